@@ -3,9 +3,10 @@ import os
 import ctypes 
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QPushButton, QLabel, QGridLayout,
-                             QMessageBox, QFrame)
+                             QMessageBox, QFrame, QCheckBox)
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QFont
+from window_manager import WindowManager
 try:
     from BiliCommander import BiliCommander
 
@@ -147,8 +148,9 @@ class Launcher(QMainWindow):
         title_extra = " (管理员模式)" if ctypes.windll.shell32.IsUserAnAdmin() else ""
         self.setWindowTitle(f"Music Production Suite - Central Hub{title_extra}")
         self.setGeometry(100, 100, 800, 600)
-        self.active_windows = []
         self.init_ui()
+        # 窗口生命周期：单实例聚焦、关闭即释放、状态栏报告内存
+        self.windows = WindowManager(self.status_lbl, not self.chk_multi.isChecked(), self)
         self.apply_main_style()
 
     def init_ui(self):
@@ -197,9 +199,16 @@ class Launcher(QMainWindow):
         layout.addLayout(grid_layout)
         layout.addStretch()
         # 底部状态
+        bottom = QHBoxLayout()
         self.status_lbl = QLabel("Ready.")
         self.status_lbl.setStyleSheet("color: #777; font-size: 12px;")
-        layout.addWidget(self.status_lbl)
+        bottom.addWidget(self.status_lbl, 1)
+        self.chk_multi = QCheckBox("允许同一工具多开")
+        self.chk_multi.setStyleSheet("color: #777; font-size: 12px;")
+        self.chk_multi.setToolTip("不勾选时，再次点击已打开的工具只会把它的窗口调到前台")
+        self.chk_multi.toggled.connect(lambda on: setattr(self.windows, 'single_instance', not on))
+        bottom.addWidget(self.chk_multi)
+        layout.addLayout(bottom)
     def create_label(self, text):
         lbl = QLabel(text)
         lbl.setStyleSheet("color: #bdc3c7; font-weight: bold; font-size: 14px; margin-top: 15px;")
@@ -210,10 +219,7 @@ class Launcher(QMainWindow):
         try:
             target_class = config['class_obj']
             if target_class:
-                window = target_class()
-                window.show()
-                self.active_windows.append(window)
-                self.status_lbl.setText(f"运行中: {config['name']}")
+                self.windows.open(key, config)
             else:
                 QMessageBox.critical(self, "错误", f"无法初始化模块: {config['name']}")
                 self.status_lbl.setText("启动失败")
@@ -1,5 +1,6 @@
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QLabel, QLineEdit, QPushButton,
                              QListWidget, QGroupBox, QMessageBox, QFileDialog,
@@ -9,47 +10,142 @@ from PyQt6.QtGui import QIcon, QAction
 
 # 引入 mutagen 用于处理标签 (支持 m4a/mp4/mp3/flac)
 try:
-    from mutagen.mp4 import MP4, MP4Cover
-    from mutagen.id3 import ID3, APIC, TALB, TPE2, TIT2, TRCK
+    import mutagen
+    from mutagen.mp4 import MP4, MP4Cover, MP4FreeForm
+    from mutagen.id3 import ID3, APIC, TALB, TPE2, TIT2, TRCK, TXXX, COMM
     from mutagen.flac import FLAC, Picture
 except ImportError:
     print("请先安装库: pip install mutagen")
     sys.exit()
+from loudness import HAS_NUMPY, analyze, album_loudness, itunnorm, replaygain_tags
+from fingerprint import FingerprintIndex, fingerprint
+from job_engine import engine
+import prom_metrics
+from prom_metrics import JOBS, JOBS_ACTIVE
 class PackWorker(QThread):
     log = pyqtSignal(str)
     progress = pyqtSignal(int)
     finished = pyqtSignal()
-    def __init__(self, files, album_name, album_artist, cover_path, auto_track):
+    def __init__(self, files, album_name, album_artist, cover_path, auto_track, replaygain=False, check_dupes=False,
+                 library_dir=''):
         super().__init__()
         self.files = files
         self.album_name = album_name
         self.album_artist = album_artist
         self.cover_path = cover_path
         self.auto_track = auto_track
+        self.replaygain = replaygain
+        self.check_dupes = check_dupes
+        self.library_dir = library_dir
+        self.failed = 0
     def run(self):
+        # 本线程启动的外部进程都归到这个工作线程名下，窗口关闭 / 任务取消时一起杀掉
+        with engine().bound(self):
+            self.run_batch()
+    def run_batch(self):
         total = len(self.files)
         self.log.emit(f"🚀 开始打包 {total} 首歌曲...")
+        if prom_metrics.start():
+            self.log.emit(f"📈 指标: http://127.0.0.1:{os.environ[prom_metrics.PORT_ENV]}/metrics")
         cover_data = None
         if self.cover_path and os.path.exists(self.cover_path):
             with open(self.cover_path, 'rb') as f:
                 cover_data = f.read()
+        if self.check_dupes: self.find_duplicates()
+        loudness = self.measure_loudness() if self.replaygain else {}
         for idx, file_path in enumerate(self.files):
+            if engine().cancelled(self):
+                self.log.emit("⏹️ 任务已取消")
+                break
+            JOBS_ACTIVE.inc(tool='packer')
+            state = 'failed'
             try:
                 filename = os.path.basename(file_path)
                 ext = os.path.splitext(filename)[1].lower()
                 self.log.emit(f"正在处理 [{idx + 1}/{total}]: {filename}")
                 track_num = idx + 1 if self.auto_track else None
+                rg = loudness.get(file_path)
                 if ext == '.m4a' or ext == '.mp4':
-                    self.tag_m4a(file_path, cover_data, track_num)
+                    self.tag_m4a(file_path, cover_data, track_num, rg)
                 elif ext == '.mp3':
-                    self.tag_mp3(file_path, cover_data, track_num)
+                    self.tag_mp3(file_path, cover_data, track_num, rg)
                 elif ext == '.flac':
-                    self.tag_flac(file_path, cover_data, track_num)
+                    self.tag_flac(file_path, cover_data, track_num, rg)
                 self.progress.emit(int((idx + 1) / total * 100))
+                state = 'ok'
             except Exception as e:
                 self.log.emit(f"❌ 错误: {filename} - {e}")
+            finally:
+                JOBS_ACTIVE.dec(tool='packer')
+                JOBS.inc(tool='packer', state=state)
+                if state == 'failed': self.failed += 1
         self.finished.emit()
-    def tag_m4a(self, path, cover_data, track_num):
+    def find_duplicates(self):
+        # 与曲库中已有的录音 (以及列表内彼此) 比对，只提醒，不自动移除；索引文件与网易云转换共用
+        if not HAS_NUMPY: return
+        # 没有指定曲库时以所选歌曲的共同上级目录为曲库
+        dirs = [os.path.dirname(os.path.abspath(p)) for p in self.files]
+        try:
+            folder = os.path.abspath(self.library_dir) if self.library_dir else os.path.commonpath(dirs)
+        except ValueError:
+            folder = dirs[0]  # 跨盘符
+        try:
+            index = FingerprintIndex(os.path.join(folder, '.fingerprints.sqlite'))
+        except Exception as e:
+            self.log.emit(f"⚠️ 无法打开指纹索引，跳过重复检查: {e}")
+            return
+        self.log.emit(f"🧬 检查重复录音 (曲库: {folder})...")
+        def one(path):
+            try:
+                fp = index.get(path)
+                if fp is not None: return fp
+                with engine().bound(self):
+                    return fingerprint(path)
+            except Exception:
+                return None
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+            fps = list(pool.map(one, self.files))
+        for path, fp in zip(self.files, fps):
+            if fp is not None and not index.known(path): index.add(path, fp)
+        added = index.scan(folder, self.log)
+        self.log.emit(f"🧬 索引完成 (新增 {added} 个文件)")
+        found, seen = 0, set()
+        for path, fp in zip(self.files, fps):
+            dup = index.match(fp, exclude=path)
+            if not dup: continue
+            pair = frozenset((os.path.abspath(path), dup[0]))
+            if pair in seen: continue
+            seen.add(pair)
+            found += 1
+            self.log.emit(f"⚠️ 疑似重复: {os.path.basename(path)} ≈ {os.path.relpath(dup[0], folder)} (差异 {dup[1]:.0%})")
+        index.close()
+        if not found: self.log.emit("🧬 未发现重复")
+    def measure_loudness(self):
+        # 每首歌一个 ffmpeg 解码进程 + NumPy 分块 K 加权，多核并行；专辑增益由各曲目的门限块合并得出，不重复解码
+        if not HAS_NUMPY:
+            self.log.emit("⚠️ 未安装 numpy，跳过响度分析 (pip install numpy)")
+            return {}
+        self.log.emit(f"🔊 并行分析响度 ({os.cpu_count() or 1} 线程)...")
+        def one(path):
+            try:
+                info = mutagen.File(path)
+                # 线程池里的线程也归到本工作线程名下
+                with engine().bound(self):
+                    return analyze(path, getattr(getattr(info, 'info', None), 'channels', 2))
+            except Exception as e:
+                self.log.emit(f"❌ 响度分析失败: {os.path.basename(path)} - {e}")
+                return None
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+            tracks = [t for t in pool.map(one, self.files) if t and t.gain is not None]
+        album_lufs, album_peak = album_loudness(tracks)
+        result = {}
+        for t in tracks:
+            self.log.emit(f"   {os.path.basename(t.path)}: {t.lufs:.1f} LUFS, 增益 {t.gain:+.2f} dB")
+            result[t.path] = dict(replaygain_tags(t, album_lufs, album_peak), iTunNORM=itunnorm(t.gain, t.peak))
+        if album_lufs is not None:
+            self.log.emit(f"💿 专辑响度 {album_lufs:.1f} LUFS")
+        return result
+    def tag_m4a(self, path, cover_data, track_num, rg=None):
         audio = MP4(path)
         # 写入专辑名
         if self.album_name:
@@ -66,8 +162,11 @@ class PackWorker(QThread):
             # 自动检测格式
             fmt = MP4Cover.FORMAT_PNG if self.cover_path.lower().endswith('.png') else MP4Cover.FORMAT_JPEG
             audio['covr'] = [MP4Cover(cover_data, imageformat=fmt)]
+        # ReplayGain + Sound Check (iTunNORM)
+        for k, v in (rg or {}).items():
+            audio[f'----:com.apple.iTunes:{k}'] = [MP4FreeForm(v.encode('utf-8'))]
         audio.save()
-    def tag_mp3(self, path, cover_data, track_num):
+    def tag_mp3(self, path, cover_data, track_num, rg=None):
         try:
             audio = ID3(path)
         except:
@@ -87,8 +186,13 @@ class PackWorker(QThread):
                 desc='Cover',
                 data=cover_data
             ))
+        for k, v in (rg or {}).items():
+            if k == 'iTunNORM':
+                audio.add(COMM(encoding=3, lang='eng', desc='iTunNORM', text=v))
+            else:
+                audio.add(TXXX(encoding=3, desc=k.upper(), text=v))
         audio.save(path)
-    def tag_flac(self, path, cover_data, track_num):
+    def tag_flac(self, path, cover_data, track_num, rg=None):
         audio = FLAC(path)
         if self.album_name: audio['album'] = self.album_name
         if self.album_artist: audio['albumartist'] = self.album_artist
@@ -105,6 +209,8 @@ class PackWorker(QThread):
             p.data = cover_data
             audio.clear_pictures()
             audio.add_picture(p)
+        for k, v in (rg or {}).items():
+            if k != 'iTunNORM': audio[k] = v
         audio.save()
 class AlbumPacker(QMainWindow):
     def __init__(self):
@@ -170,6 +276,23 @@ class AlbumPacker(QMainWindow):
         self.chk_track = QCheckBox("根据列表顺序自动写入音轨号 (1, 2, 3...)")
         self.chk_track.setChecked(True)
         meta_layout.addWidget(self.chk_track)
+        self.chk_rg = QCheckBox("计算响度并写入 ReplayGain / Sound Check (音量统一)")
+        self.chk_rg.setChecked(HAS_NUMPY)
+        self.chk_rg.setEnabled(HAS_NUMPY)
+        meta_layout.addWidget(self.chk_rg)
+        self.chk_dup = QCheckBox("打包前检查重复录音 (音频指纹)")
+        self.chk_dup.setChecked(HAS_NUMPY)
+        self.chk_dup.setEnabled(HAS_NUMPY)
+        meta_layout.addWidget(self.chk_dup)
+        h4 = QHBoxLayout()
+        h4.addWidget(QLabel("曲库目录:"))
+        self.in_library = QLineEdit()
+        self.in_library.setPlaceholderText("与曲库中已有的歌比对，留空则只看所选歌曲所在目录")
+        btn_library = QPushButton("浏览...")
+        btn_library.clicked.connect(self.sel_library)
+        h4.addWidget(self.in_library)
+        h4.addWidget(btn_library)
+        meta_layout.addLayout(h4)
 
         meta_group.setLayout(meta_layout)
         layout.addWidget(meta_group)
@@ -199,6 +322,9 @@ class AlbumPacker(QMainWindow):
     def sel_cover(self):
         f, _ = QFileDialog.getOpenFileName(self, "选择封面", "", "Images (*.jpg *.png *.jpeg)")
         if f: self.in_cover.setText(f)
+    def sel_library(self):
+        d = QFileDialog.getExistingDirectory(self, "选择曲库目录", self.in_library.text())
+        if d: self.in_library.setText(d)
 
     def log(self, msg):
         self.log_txt.append(msg)
@@ -222,7 +348,8 @@ class AlbumPacker(QMainWindow):
             if res == QMessageBox.StandardButton.No: return
 
         self.btn_run.setEnabled(False)
-        self.worker = PackWorker(files, album, artist, cover, self.chk_track.isChecked())
+        self.worker = PackWorker(files, album, artist, cover, self.chk_track.isChecked(), self.chk_rg.isChecked(),
+                                 self.chk_dup.isChecked(), self.in_library.text().strip())
         self.worker.log.connect(self.log)
         self.worker.progress.connect(self.pbar.setValue)
         self.worker.finished.connect(lambda: [self.btn_run.setEnabled(True), QMessageBox.information(self, "完成",
@@ -0,0 +1,341 @@
+"""离线测速工具：本地 HTTP 站点 + 自定义 yt-dlp 提取器，端到端驱动 BiliWorker / YouTubeWorker。
+
+用法示例:
+    python bench_harness.py --tool bili --items 30 --page-size 10 --mode both \\
+        --latency 0.05 --bandwidth 4M --error-rate 0.05
+
+服务端可配置延迟、带宽、403/412 注入与 Cookie 校验，结束后输出吞吐、并发、重试与内存统计。
+"""
+import os
+import re
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from yt_dlp.extractor.common import InfoExtractor
+from yt_dlp.utils import OnDemandPagedList
+
+from rate_limiter import LimitedYoutubeDL
+
+COOKIE_NAME = 'SESSDATA'
+COOKIE_VALUE = 'bench'
+
+
+def parse_size(text):
+    m = re.fullmatch(r'(\d+(?:\.\d+)?)([KMG]?)', text.strip().upper())
+    if not m: raise argparse.ArgumentTypeError(f"无法解析大小: {text}")
+    return int(float(m.group(1)) * {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}[m.group(2)])
+
+
+def make_media(folder, duration):
+    """用 ffmpeg 生成测试素材 (纯视频 mp4 / 纯音频 m4a / 封面 jpg)；没有 ffmpeg 时退回随机字节"""
+    paths = {k: os.path.join(folder, n) for k, n in
+             (('video', 'video.mp4'), ('audio', 'audio.m4a'), ('thumb', 'thumb.jpg'))}
+    cmds = {
+        'video': ['-f', 'lavfi', '-i', f'testsrc=size=640x360:rate=25:duration={duration}',
+                  '-c:v', 'mpeg4', '-q:v', '5', '-an'],
+        'audio': ['-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={duration}',
+                  '-c:a', 'aac', '-b:a', '192k', '-ac', '2'],
+        'thumb': ['-f', 'lavfi', '-i', 'color=c=red:s=320x180', '-frames:v', '1'],
+    }
+    for key, args in cmds.items():
+        try:
+            subprocess.run(['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error'] + args + [paths[key]],
+                           check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except Exception:
+            print(f"⚠️ ffmpeg 不可用，{key} 使用随机字节 (后期处理会失败)")
+            with open(paths[key], 'wb') as f:
+                f.write(os.urandom(256 * 1024))
+    return paths
+
+
+class BenchConfig:
+    def __init__(self, items=20, page_size=10, latency=0.0, bandwidth=0, error_rate=0.0,
+                 require_cookie=True, segments=8):
+        self.items = items
+        self.page_size = page_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.require_cookie = require_cookie
+        self.segments = segments
+
+
+class BenchStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.injected = 0
+        self.rejected_cookie = 0
+        self.active = 0
+        self.max_active = 0
+        self.paths = {}
+
+    def enter(self, kind):
+        with self.lock:
+            self.requests += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.paths[kind] = self.paths.get(kind, 0) + 1
+
+    def leave(self, sent):
+        with self.lock:
+            self.active -= 1
+            self.bytes_sent += sent
+
+
+class BenchServer:
+    """在 127.0.0.1 随机端口上提供合成的播放列表、视频元数据、DASH 分片与封面"""
+
+    def __init__(self, config, media):
+        self.config = config
+        self.media = media
+        self.stats = BenchStats()
+        with open(media['video'], 'rb') as f:
+            self.video = f.read()
+        with open(media['audio'], 'rb') as f:
+            self.audio = f.read()
+        with open(media['thumb'], 'rb') as f:
+            self.thumb = f.read()
+        seg = -(-len(self.video) // config.segments)
+        self.video_segments = [self.video[i:i + seg] for i in range(0, len(self.video), seg)]
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def route(self, path):
+        cfg = self.config
+        m = re.fullmatch(r'/playlist/(\w+)/page/(\d+)', path)
+        if m:
+            page = int(m.group(2))
+            ids = range(page * cfg.page_size, min(cfg.items, (page + 1) * cfg.page_size))
+            entries = [{'id': f'v{i:05d}', 'title': f'Bench Video {i}'} for i in ids]
+            return 'page', 'application/json', json.dumps({'entries': entries}).encode()
+        m = re.fullmatch(r'/video/(\w+)\.json', path)
+        if m:
+            vid = m.group(1)
+            meta = {'id': vid, 'title': f'Bench {vid}', 'uploader': 'Bench Uploader',
+                    'segments': len(self.video_segments), 'thumbnail': f'{self.base}/thumb/{vid}.jpg'}
+            return 'meta', 'application/json', json.dumps(meta).encode()
+        m = re.fullmatch(r'/media/(\w+)/video/seg(\d+)', path)
+        if m and int(m.group(2)) < len(self.video_segments):
+            return 'segment', 'video/mp4', self.video_segments[int(m.group(2))]
+        if re.fullmatch(r'/media/(\w+)/audio\.m4a', path):
+            return 'audio', 'audio/mp4', self.audio
+        if re.fullmatch(r'/thumb/(\w+)\.jpg', path):
+            return 'thumb', 'image/jpeg', self.thumb
+        return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                cfg = server.config
+                found = server.route(self.path.split('?')[0])
+                kind = found[0] if found else 'miss'
+                server.stats.enter(kind)
+                sent = 0
+                try:
+                    if cfg.latency: time.sleep(cfg.latency)
+                    if not found:
+                        return self._empty(404)
+                    if cfg.require_cookie and f"{COOKIE_NAME}={COOKIE_VALUE}" not in (self.headers.get('Cookie') or ''):
+                        with server.stats.lock: server.stats.rejected_cookie += 1
+                        return self._empty(403)
+                    if kind != 'thumb' and random.random() < cfg.error_rate:
+                        with server.stats.lock: server.stats.injected += 1
+                        return self._empty(412 if kind in ('page', 'meta') else 403)
+                    _, ctype, body = found
+                    status, body = self._apply_range(body)
+                    self.send_response(status)
+                    self.send_header('Content-Type', ctype)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.send_header('Accept-Ranges', 'bytes')
+                    self.end_headers()
+                    sent = self._write_throttled(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    server.stats.leave(sent)
+
+            def _empty(self, code):
+                self.send_response(code)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def _apply_range(self, body):
+                m = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+                if not m: return 200, body
+                start = int(m.group(1))
+                end = int(m.group(2)) if m.group(2) else len(body) - 1
+                part = body[start:end + 1]
+                self._range = f"bytes {start}-{start + len(part) - 1}/{len(body)}"
+                return 206, part
+
+            def send_response(self, code, message=None):
+                super().send_response(code, message)
+                if code == 206: self.send_header('Content-Range', self._range)
+
+            def _write_throttled(self, body):
+                bw = server.config.bandwidth
+                chunk = 16 * 1024
+                sent = 0
+                for i in range(0, len(body), chunk):
+                    piece = body[i:i + chunk]
+                    self.wfile.write(piece)
+                    sent += len(piece)
+                    if bw: time.sleep(len(piece) / bw)
+                return sent
+
+        return Handler
+
+
+class LocalBenchIE(InfoExtractor):
+    IE_NAME = 'localbench'
+    PAGE_SIZE = 10
+    _VALID_URL = r'https?://127\.0\.0\.1:(?P<port>\d+)/(?P<kind>playlist|watch)/(?P<id>\w+)'
+
+    def _real_extract(self, url):
+        m = self._match_valid_url(url)
+        base = f"http://127.0.0.1:{m.group('port')}"
+        item_id = m.group('id')
+        if m.group('kind') == 'playlist':
+            def fetch_page(page):
+                data = self._download_json(f'{base}/playlist/{item_id}/page/{page}', item_id,
+                                           note=f'Downloading page {page + 1}')
+                for e in data['entries']:
+                    yield self.url_result(f"{base}/watch/{e['id']}", 'LocalBench', e['id'], e['title'])
+
+            return self.playlist_result(OnDemandPagedList(fetch_page, self.PAGE_SIZE), item_id, f'Bench {item_id}')
+
+        meta = self._download_json(f'{base}/video/{item_id}.json', item_id)
+        formats = [{
+            'format_id': 'dash-video',
+            'url': f'{base}/media/{item_id}/video/',
+            'fragment_base_url': f'{base}/media/{item_id}/video/',
+            'fragments': [{'path': f'seg{i}'} for i in range(meta['segments'])],
+            'protocol': 'http_dash_segments',
+            'ext': 'mp4', 'vcodec': 'mp4v.20.9', 'acodec': 'none', 'width': 640, 'height': 360,
+        }, {
+            'format_id': 'dash-audio',
+            'url': f'{base}/media/{item_id}/audio.m4a',
+            'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'asr': 48000, 'abr': 192,
+        }]
+        return {
+            'id': item_id, 'title': meta['title'], 'uploader': meta['uploader'],
+            'thumbnail': meta['thumbnail'], 'formats': formats,
+        }
+
+
+def write_cookie_file(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("# Netscape HTTP Cookie File\n\n")
+        f.write(f"127.0.0.1\tFALSE\t/\tFALSE\t0\t{COOKIE_NAME}\t{COOKIE_VALUE}\n")
+
+
+def run_worker(tool, url, save_dir, mode, cookie_file, verbose):
+    from PyQt6.QtCore import Qt
+    if tool == 'bili':
+        from BiliCommander import BiliWorker as WorkerClass
+    else:
+        from youtube import YouTubeWorker as WorkerClass
+    worker = WorkerClass({'url': url, 'save_dir': save_dir, 'mode': mode,
+                          'album_name': 'Bench', 'auto_cookie': False})
+    worker.cookie_filename = cookie_file
+    logs = []
+
+    def on_log(msg):
+        logs.append(msg)
+        if verbose: print(msg)
+
+    # 后期处理线程也会发日志，这里没有事件循环，必须直连
+    worker.log_signal.connect(on_log, Qt.ConnectionType.DirectConnection)
+    worker.run()
+    return logs
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="BiliWorker / YouTubeWorker 离线测速")
+    ap.add_argument('--tool', choices=['bili', 'youtube'], default='bili')
+    ap.add_argument('--mode', choices=['audio', 'video', 'both'], default='both')
+    ap.add_argument('--items', type=int, default=20)
+    ap.add_argument('--page-size', type=int, default=10)
+    ap.add_argument('--duration', type=int, default=20, help="测试素材时长 (秒)")
+    ap.add_argument('--segments', type=int, default=8)
+    ap.add_argument('--latency', type=float, default=0.0, help="每个请求的附加延迟 (秒)")
+    ap.add_argument('--bandwidth', type=parse_size, default=0, help="每连接带宽，如 2M (字节/秒)")
+    ap.add_argument('--error-rate', type=float, default=0.0, help="注入 403/412 的概率")
+    ap.add_argument('--no-cookie-check', action='store_true')
+    ap.add_argument('--keep', action='store_true', help="保留输出目录")
+    ap.add_argument('-v', '--verbose', action='store_true')
+    args = ap.parse_args(argv)
+
+    work = tempfile.mkdtemp(prefix='musicsuite_bench_')
+    media_dir = os.path.join(work, 'media')
+    save_dir = os.path.join(work, 'out')
+    os.makedirs(media_dir)
+    cookie_file = os.path.join(work, 'bench_cookies.txt')
+    write_cookie_file(cookie_file)
+
+    config = BenchConfig(args.items, args.page_size, args.latency, args.bandwidth, args.error_rate,
+                         not args.no_cookie_check, args.segments)
+    server = BenchServer(config, make_media(media_dir, args.duration)).start()
+    LocalBenchIE.PAGE_SIZE = args.page_size
+    LimitedYoutubeDL.extra_extractors = (LocalBenchIE,)
+    url = f"{server.base}/playlist/bench"
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    try:
+        logs = run_worker(args.tool, url, save_dir, args.mode, cookie_file, args.verbose)
+    finally:
+        wall = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        server.stop()
+        LimitedYoutubeDL.extra_extractors = ()
+
+    outputs = [f for f in os.listdir(save_dir) if f.endswith(('.mp4', '.m4a'))] if os.path.isdir(save_dir) else []
+    st = server.stats
+    print(f"\n=== {args.tool} / {args.mode} / {args.items} 条 ===")
+    print(f"耗时 {wall:.2f}s  产物 {len(outputs)} 个  吞吐 {args.items / wall:.2f} 条/s")
+    print(f"请求 {st.requests} 次 {st.paths}  发送 {st.bytes_sent / 1048576:.1f} MiB "
+          f"({st.bytes_sent / 1048576 / wall:.2f} MiB/s)")
+    print(f"最大并发连接 {st.max_active}  注入错误 {st.injected}  Cookie 拒绝 {st.rejected_cookie}")
+    print(f"Python 内存峰值 {peak / 1048576:.1f} MiB (tracemalloc)")
+    for line in logs:
+        if line.startswith(('│', '┌', '└')): print(line)
+    if args.keep:
+        print(f"输出目录: {work}")
+    else:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
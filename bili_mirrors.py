@@ -0,0 +1,173 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from yt_dlp.networking import Request
+
+# upos 源站镜像：同一个 /upgcxcode/ 路径 (含签名) 在这些主机上都能访问
+UPOS_HOSTS = [
+    'upos-sz-mirrorali.bilivideo.com',
+    'upos-sz-mirrorcos.bilivideo.com',
+    'upos-sz-mirrorhw.bilivideo.com',
+    'upos-sz-mirrorakam.akamaized.net',
+]
+PROBE_BYTES = 256 * 1024
+PROBE_TIMEOUT = 8
+# 测速结果在一批任务内复用，过期后重新探测
+STALE_AFTER = 300
+
+
+class MirrorStalled(Exception):
+    """下载中途吞吐崩溃，需要换镜像 (由进度回调抛出，yt-dlp 会保留 .part 以便续传)"""
+
+    def __init__(self, host, rate):
+        super().__init__(f"{host} 速度跌到 {rate / 1024:.0f} KB/s")
+        self.host = host
+
+
+def _swappable(url):
+    p = urlparse(url or '')
+    return p.scheme in ('http', 'https') and '/upgcxcode/' in p.path
+
+
+def _with_host(url, host):
+    return urlparse(url)._replace(netloc=host).geturl()
+
+
+class HostStats:
+    """每个 CDN 主机的吞吐 (指数滑动平均)，探测与实际下载都会更新"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rate = {}
+        self.stamp = {}
+
+    def update(self, host, rate, weight=0.5):
+        with self.lock:
+            old = self.rate.get(host)
+            self.rate[host] = rate if old is None else old * (1 - weight) + rate * weight
+            self.stamp[host] = time.monotonic()
+
+    def penalize(self, host):
+        with self.lock:
+            self.rate[host] = self.rate.get(host, 0) / 4
+            self.stamp[host] = time.monotonic()
+
+    def fresh(self, host):
+        with self.lock:
+            return host in self.stamp and time.monotonic() - self.stamp[host] < STALE_AFTER
+
+    def get(self, host):
+        with self.lock:
+            return self.rate.get(host, 0.0)
+
+
+_stats = HostStats()
+
+
+class MirrorPicker:
+    """为 B站 DASH 流挑选最快的 CDN 主机。
+
+    候选 = 原始主机 + backup_url 主机 + upos 镜像；没有新鲜测速数据的主机用一个小的 Range 请求
+    并行测速，按吞吐选最快的并改写 info 里所有格式的 URL。下载中 progress_hook 监控滑动窗口吞吐，
+    跌到预期的 1/4 以下时抛出 MirrorStalled，由调用方换下一个镜像续传。
+    """
+
+    def __init__(self, logger=None, collapse_ratio=0.25, window=5.0, grace=6.0):
+        self.logger = logger
+        self.collapse_ratio = collapse_ratio
+        self.window = window
+        self.grace = grace
+        self.active = None
+        self.expected = 0.0
+        self.samples = deque()
+        self.started = None
+        self.file = None
+
+    def candidates(self, fmt):
+        hosts = []
+        urls = [fmt.get('url')] + list(fmt.get('backup_url') or fmt.get('backup_urls') or [])
+        for u in urls + [_with_host(fmt['url'], h) for h in UPOS_HOSTS]:
+            host = urlparse(u).netloc
+            if host and host not in hosts: hosts.append(host)
+        return hosts
+
+    def probe(self, ydl, fmt, host):
+        headers = dict(fmt.get('http_headers') or {})
+        headers['Range'] = f"bytes=0-{PROBE_BYTES - 1}"
+        t0 = time.perf_counter()
+        try:
+            with ydl.urlopen(Request(_with_host(fmt['url'], host), headers=headers,
+                                     extensions={'timeout': PROBE_TIMEOUT})) as res:
+                got = len(res.read(PROBE_BYTES))
+        except Exception:
+            _stats.update(host, 0.0, weight=1.0)
+            return
+        _stats.update(host, got / max(time.perf_counter() - t0, 1e-3))
+
+    def choose(self, ydl, info, exclude=()):
+        """测速并改写 info，返回选中的主机；不是 upos 源站的 URL 返回 None"""
+        # 上一个条目的主机不能留到这个条目的进度回调里
+        self.release()
+        fmt = self._reference(info)
+        if not fmt: return None
+        hosts = [h for h in self.candidates(fmt) if h not in exclude]
+        todo = [h for h in hosts if not _stats.fresh(h)]
+        if todo:
+            with ThreadPoolExecutor(max_workers=len(todo)) as pool:
+                list(pool.map(lambda h: self.probe(ydl, fmt, h), todo))
+        if not hosts: return None
+        best = max(hosts, key=_stats.get)
+        if _stats.get(best) <= 0: return None
+        self.rewrite(info, best)
+        self.active = best
+        self.expected = _stats.get(best)
+        self.samples.clear()
+        self.started = None
+        if self.logger:
+            ranking = ", ".join(f"{h.split('.')[0]} {_stats.get(h) / 1048576:.1f}MB/s" for h in
+                                sorted(hosts, key=_stats.get, reverse=True)[:3])
+            self.logger.emit(f"🛰️ CDN: {best} ({ranking})")
+        return best
+
+    def _reference(self, info):
+        # 以最大的那条流 (通常是视频) 作为测速样本
+        fmts = [f for f in (info.get('requested_formats') or info.get('formats') or [info]) if _swappable(f.get('url'))]
+        if not fmts: return None
+        return max(fmts, key=lambda f: f.get('filesize') or f.get('tbr') or 0)
+
+    def rewrite(self, info, host):
+        for f in [info] + list(info.get('formats') or []) + list(info.get('requested_formats') or []):
+            for key in ('url', 'fragment_base_url'):
+                if _swappable(f.get(key)): f[key] = _with_host(f[key], host)
+
+    def release(self):
+        self.active = None
+
+    def progress_hook(self, d):
+        if not self.active or d.get('status') != 'downloading': return
+        now = time.monotonic()
+        done = d.get('downloaded_bytes') or 0
+        # 视频流、音频流依次下载，换文件时重新计时
+        if d.get('filename') != self.file or self.started is None:
+            self.file = d.get('filename')
+            self.started = now
+            self.samples.clear()
+        self.samples.append((now, done))
+        while self.samples and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+        if now - self.started < self.grace: return
+        t0, b0 = self.samples[0]
+        if now - t0 < self.window * 0.8 or done < b0: return
+        rate = (done - b0) / (now - t0)
+        _stats.update(self.active, rate, weight=0.2)
+        total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+        # 快下完了就不折腾
+        if total and total - done < 4 * 1048576: return
+        if rate < self.expected * self.collapse_ratio:
+            host = self.active
+            _stats.penalize(host)
+            self.active = None
+            raise MirrorStalled(host, rate)
@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from prom_metrics import COOKIE_REFRESHES
+
+try:
+    import rookiepy
+
+    HAS_ROOKIE = True
+except ImportError:
+    HAS_ROOKIE = False
+
+BROWSERS = [("Chrome", "chrome"), ("Edge", "edge"), ("Firefox", "firefox")]
+# 决定登录态的 Cookie；缓存是否有效只看它们的过期时间，几分钟就过期的统计 / 跟踪 Cookie 不算
+AUTH_COOKIES = {
+    'bilibili.com': ('SESSDATA', 'bili_jct', 'DedeUserID'),
+    'youtube.com': ('SID', 'HSID', 'SSID', 'LOGIN_INFO', '__Secure-1PSID', '__Secure-3PSID'),
+    'google.com': ('SID', 'HSID', 'SSID', '__Secure-1PSID', '__Secure-3PSID'),
+}
+
+
+def _field(c, key, default):
+    if isinstance(c, dict):
+        return c.get(key, default)
+    return getattr(c, key, default)
+
+
+def _expires(c):
+    return int(_field(c, 'expires', 0) or 0)
+
+
+def render_netscape(cookies):
+    """生成 Netscape cookie 文件的正文 (不含带时间戳的头部)"""
+    lines = []
+    for c in cookies:
+        domain = _field(c, 'domain', '')
+        path = _field(c, 'path', '/')
+        secure = "TRUE" if _field(c, 'secure', False) else "FALSE"
+        name = _field(c, 'name', '')
+        value = _field(c, 'value', '')
+        flag = "TRUE" if domain.startswith('.') else "FALSE"
+        lines.append(f"{domain}\t{flag}\t{path}\t{secure}\t{_expires(c)}\t{name}\t{value}\n")
+    return "".join(lines)
+
+
+class CookieManager:
+    """进程内共享的 Cookie 缓存。
+
+    - 按域名缓存 Cookie 及其过期时间，未过期时不再读浏览器
+    - 并行探测所有浏览器，选出最新的有效集合
+    - 并发的刷新请求合并为一次 (single-flight)
+    - 内容真正变化时才重写 cookie 文件，并递增 version
+    """
+
+    def __init__(self, domains, target_file, margin=300):
+        self.domains = list(domains)
+        self.target_file = target_file
+        self.margin = margin
+        self.auth = {name for d in self.domains for name in AUTH_COOKIES.get(d, ())}
+        self.cookies = []
+        self.source = None
+        self.version = 0
+        self.cond = threading.Condition()
+        self.refreshing = False
+        self.last_result = (False, "尚未刷新")
+
+    def valid(self):
+        """缓存非空，且登录相关的 Cookie (未知域名时为全部) 在 margin 秒后仍有效"""
+        if not self.cookies: return False
+        deadline = time.time() + self.margin
+        watched = [c for c in self.cookies if _field(c, 'name', '') in self.auth] if self.auth else self.cookies
+        return all(_expires(c) == 0 or _expires(c) > deadline for c in watched)
+
+    def refresh(self, logger=None, force=False):
+        if not HAS_ROOKIE: return False, "缺少 rookiepy"
+        with self.cond:
+            if not force and self.valid():
+                return True, f"Cookie 缓存有效 ({self.source}, {len(self.cookies)} 条)"
+            if self.refreshing:
+                # 已有线程在刷新，等它的结果
+                while self.refreshing:
+                    self.cond.wait()
+                return self.last_result
+            self.refreshing = True
+        result = (False, "刷新异常")
+        try:
+            result = self._refresh(logger)
+        finally:
+            COOKIE_REFRESHES.inc(result='ok' if result[0] else 'failed')
+            with self.cond:
+                self.refreshing = False
+                self.last_result = result
+                self.cond.notify_all()
+        return result
+
+    def _probe(self, label, func_name):
+        cookies = getattr(rookiepy, func_name)(self.domains)
+        now = time.time()
+        # 丢弃已过期的条目
+        return [c for c in cookies if _expires(c) == 0 or _expires(c) > now]
+
+    def _refresh(self, logger):
+        if logger: logger.emit(f"并行读取浏览器 Cookie ({', '.join(b[0] for b in BROWSERS)})...")
+        candidates = []
+        with ThreadPoolExecutor(max_workers=len(BROWSERS)) as pool:
+            futures = [(label, pool.submit(self._probe, label, fn)) for label, fn in BROWSERS]
+            for label, fut in futures:
+                try:
+                    cookies = fut.result()
+                except Exception as e:
+                    if logger: logger.emit(f"{label} 失败: {e}")
+                    continue
+                if cookies:
+                    candidates.append((label, cookies))
+        if not candidates:
+            return False, "所有浏览器均失败或未找到有效 Cookie，请确保已在浏览器登录。"
+        # 最新的一组：最晚过期时间优先，其次条目数
+        label, cookies = max(candidates, key=lambda x: (max(_expires(c) for c in x[1]), len(x[1])))
+        try:
+            changed = self._write(cookies, label)
+        except Exception as e:
+            return False, f"写入错误: {e}"
+        self.cookies = cookies
+        self.source = label
+        state = "已更新文件" if changed else "内容未变化"
+        return True, f"成功从 {label} 刷新 ({len(cookies)} 条, {state})"
+
+    def _write(self, cookies, label):
+        body = render_netscape(cookies)
+        if os.path.exists(self.target_file):
+            with open(self.target_file, 'r', encoding='utf-8') as f:
+                old = "".join(l for l in f if l.strip() and not l.startswith('#'))
+            if old == body: return False
+        with open(self.target_file, 'w', encoding='utf-8') as f:
+            f.write("# Netscape HTTP Cookie File\n")
+            f.write(f"# Generated at {datetime.now()} from {label}\n\n")
+            f.write(body)
+        self.version += 1
+        return True
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def cookie_manager(domains, target_file):
+    """同一个 cookie 文件在进程内只对应一个管理器"""
+    key = os.path.abspath(target_file)
+    with _managers_lock:
+        if key not in _managers:
+            _managers[key] = CookieManager(domains, target_file)
+        return _managers[key]
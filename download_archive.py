@@ -0,0 +1,60 @@
+import os
+import threading
+
+# 模式 -> 需要完成的部分
+MODE_PARTS = {
+    'video': {'video'},
+    'audio': {'audio'},
+    'both': {'video', 'audio'},
+}
+
+
+def archive_key(entry):
+    """从侦察条目 / 完整 info 生成 '提取器 ID' 键，与 yt-dlp 的 archive 格式一致"""
+    if not entry: return None
+    ie = entry.get('ie_key') or entry.get('extractor_key') or entry.get('extractor')
+    vid = entry.get('id')
+    if not ie or not vid: return None
+    return f"{ie.lower()} {vid}"
+
+
+class DownloadArchive:
+    """按 提取器+视频ID 记录已完成的部分 (video/audio)。
+
+    文件为追加写的文本行: '<extractor> <id> <part>'，启动时一次性载入字典，
+    之后的查询都是 O(1)，不需要任何网络请求。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) != 3: continue
+                    self.done.setdefault(f"{parts[0]} {parts[1]}", set()).add(parts[2])
+
+    def __len__(self):
+        return len(self.done)
+
+    def is_done(self, entry, mode):
+        key = archive_key(entry)
+        if not key: return False
+        with self.lock:
+            return MODE_PARTS.get(mode, {mode}) <= self.done.get(key, set())
+
+    def record(self, entry, *parts):
+        key = archive_key(entry)
+        if not key: return
+        with self.lock:
+            known = self.done.setdefault(key, set())
+            new_parts = [p for p in parts if p not in known]
+            if not new_parts: return
+            known.update(new_parts)
+            folder = os.path.dirname(self.path)
+            if folder: os.makedirs(folder, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for p in new_parts:
+                    f.write(f"{key} {p}\n")
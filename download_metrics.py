@@ -0,0 +1,168 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+from prom_metrics import BYTES, ENCODE_SECONDS, JOBS, JOBS_ACTIVE, RETRIES
+
+PHASES = ['extract', 'download', 'merge', 'postprocess']
+
+
+class ItemMetrics:
+    def __init__(self, key, title=None):
+        self.key = key
+        self.title = title
+        self.started = time.time()
+        self.phases = {}
+        self.streams = {}
+        self.retries = 0
+        self.status = 'ok'
+        self.merge_t0 = None
+        # 后期处理对音轨的处理方式: 'copy' / 'encode'
+        self.audio = None
+
+    def to_dict(self):
+        return {
+            'type': 'item', 'key': self.key, 'title': self.title, 'status': self.status,
+            'started': self.started, 'retries': self.retries,
+            'phases': {k: round(v, 3) for k, v in self.phases.items()},
+            'streams': self.streams, 'audio': self.audio,
+        }
+
+
+class DownloadMetrics:
+    """通过 yt-dlp 的 progress_hooks / postprocessor_hooks 采集下载吞吐。
+
+    每个视频、每条流记录字节数、速度、首字节时间、分片与重试次数，
+    以及 提取 / 下载 / 合并 / 后期处理 各阶段耗时。
+    每个条目结束时追加一行 JSONL，run 结束时输出汇总表。
+    """
+
+    def __init__(self, jsonl_path=None, tool=None):
+        self.jsonl_path = jsonl_path
+        # Prometheus 指标里的 tool 标签
+        self.tool = tool
+        self.lock = threading.Lock()
+        self.items = {}
+        self.finished = []
+        self.current = None
+        self.run_started = time.time()
+
+    def begin(self, key, title=None):
+        with self.lock:
+            m = self.items.get(key)
+            if m is None:
+                m = self.items[key] = ItemMetrics(key, title)
+                JOBS_ACTIVE.inc(tool=self.tool)
+            return m
+
+    @contextmanager
+    def phase(self, m, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                m.phases[name] = m.phases.get(name, 0.0) + time.perf_counter() - t0
+
+    def progress_hook(self, d):
+        m = self.current
+        if m is None: return
+        fmt = (d.get('info_dict') or {}).get('format_id') or 'default'
+        with self.lock:
+            s = m.streams.setdefault(fmt, {'bytes': 0, 'elapsed': 0.0, 'ttfb': None, 'fragments': 0})
+            done = d.get('downloaded_bytes') or 0
+            if s['ttfb'] is None and done and d.get('elapsed') is not None:
+                s['ttfb'] = round(d['elapsed'], 3)
+            if d.get('fragment_count'):
+                s['fragments'] = d['fragment_count']
+            if d.get('status') == 'finished':
+                s['bytes'] = d.get('total_bytes') or done or s['bytes']
+                s['elapsed'] = round(d.get('elapsed') or 0.0, 3)
+                s['speed'] = round(s['bytes'] / s['elapsed']) if s['elapsed'] else None
+            elif d.get('status') == 'downloading':
+                s['bytes'] = done
+                s['elapsed'] = round(d.get('elapsed') or 0.0, 3)
+
+    def postprocessor_hook(self, d):
+        m = self.current
+        if m is None or d.get('postprocessor') != 'Merger': return
+        with self.lock:
+            if d.get('status') == 'started':
+                m.merge_t0 = time.perf_counter()
+            elif d.get('status') == 'finished' and m.merge_t0 is not None:
+                m.phases['merge'] = m.phases.get('merge', 0.0) + time.perf_counter() - m.merge_t0
+
+    def on_message(self, msg):
+        # yt-dlp 的重试提示走 logger.debug / warning
+        if self.current is not None and 'Retrying' in msg:
+            with self.lock:
+                self.current.retries += 1
+
+    def finish(self, m, status=None):
+        with self.lock:
+            if status: m.status = status
+            # download 阶段包含了 yt-dlp 的合并，拆开统计
+            if 'merge' in m.phases and 'download' in m.phases:
+                m.phases['download'] = max(0.0, m.phases['download'] - m.phases['merge'])
+            self.items.pop(m.key, None)
+            self.finished.append(m)
+            if self.current is m: self.current = None
+        self._export(m)
+        self._append(m.to_dict())
+
+    def failed_count(self):
+        with self.lock:
+            return sum(1 for m in self.finished if m.status != 'ok')
+
+    def skipped(self):
+        JOBS.inc(tool=self.tool, state='skipped')
+
+    def _export(self, m):
+        JOBS_ACTIVE.dec(tool=self.tool)
+        JOBS.inc(tool=self.tool, state=m.status)
+        BYTES.inc(sum(s['bytes'] for s in m.streams.values()), tool=self.tool)
+        RETRIES.inc(m.retries, tool=self.tool)
+        if 'postprocess' in m.phases: ENCODE_SECONDS.observe(m.phases['postprocess'], tool=self.tool)
+
+    def _append(self, record):
+        if not self.jsonl_path: return
+        try:
+            with self.lock, open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError:
+            pass
+
+    def summary(self):
+        """汇总表 (每行一条字符串) 并把 run 记录写入 JSONL"""
+        with self.lock:
+            items = list(self.finished)
+        total_bytes = sum(s['bytes'] for m in items for s in m.streams.values())
+        dl_time = sum(s['elapsed'] for m in items for s in m.streams.values())
+        ttfbs = [s['ttfb'] for m in items for s in m.streams.values() if s['ttfb'] is not None]
+        phases = {p: sum(m.phases.get(p, 0.0) for m in items) for p in PHASES}
+        extra = sorted({k for m in items for k in m.phases} - set(PHASES))
+        for p in extra:
+            phases[p] = sum(m.phases.get(p, 0.0) for m in items)
+        record = {
+            'type': 'run', 'started': self.run_started, 'wall': round(time.time() - self.run_started, 3),
+            'items': len(items), 'failed': sum(1 for m in items if m.status != 'ok'),
+            'bytes': total_bytes, 'avg_speed': round(total_bytes / dl_time) if dl_time else None,
+            'avg_ttfb': round(sum(ttfbs) / len(ttfbs), 3) if ttfbs else None,
+            'retries': sum(m.retries for m in items),
+            'audio_copied': sum(1 for m in items if m.audio == 'copy'),
+            'audio_encoded': sum(1 for m in items if m.audio == 'encode'),
+            'phases': {k: round(v, 3) for k, v in phases.items()},
+        }
+        self._append(record)
+        lines = [
+            "┌──────────── 本次下载统计 ────────────",
+            f"│ 条目 {record['items']} (失败 {record['failed']})  总耗时 {record['wall']:.1f}s",
+            f"│ 流量 {total_bytes / 1048576:.1f} MiB  平均速度 {(record['avg_speed'] or 0) / 1048576:.2f} MiB/s",
+            f"│ 平均首字节 {record['avg_ttfb'] if record['avg_ttfb'] is not None else '-'}s  重试 {record['retries']} 次",
+            f"│ 音轨 直通 {record['audio_copied']}  转码 {record['audio_encoded']}",
+        ]
+        for name, secs in record['phases'].items():
+            lines.append(f"│ {name:<12}{secs:>10.1f}s")
+        lines.append("└──────────────────────────────────────")
+        return lines
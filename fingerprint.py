@@ -0,0 +1,163 @@
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+from job_engine import engine
+from stall_watchdog import ProcessStalled
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+RATE = 5512
+SECONDS = 120  # 只取开头两分钟
+FRAME = 2048  # ~0.37s
+HOP = 256  # ~46ms
+BANDS = 33  # 300-2000Hz 对数频带，相邻差分得到 32 bit
+MAX_BER = 0.25  # 误码率低于此值视为同一录音
+MIN_OVERLAP = 200  # 至少重叠约 9 秒才比较
+AUDIO_EXTS = ('.m4a', '.mp3', '.flac', '.wav', '.ogg', '.mp4')
+
+
+def fingerprint(path, seconds=SECONDS):
+    """解码一小段降采样单声道 PCM，计算频带能量差分指纹 (每帧一个 uint32)。
+
+    只看能量在频率、时间上的升降，与音量、编码格式、采样率无关。解码失败或太短时返回 None。
+    """
+    cmd = ['ffmpeg', '-v', 'error', '-i', path, '-map', '0:a:0', '-t', str(seconds),
+           '-ac', '1', '-ar', str(RATE), '-f', 's16le', '-']
+    try:
+        raw = engine().run(cmd).stdout
+    except ProcessStalled:
+        return None
+    return fingerprint_pcm(np.frombuffer(raw[:len(raw) // 2 * 2], dtype='<i2').astype(np.float32))
+
+
+def fingerprint_pcm(x):
+    if len(x) < FRAME * 4: return None
+    frames = sliding_window_view(x, FRAME)[::HOP] * np.hanning(FRAME).astype(np.float32)
+    spec = np.square(np.abs(np.fft.rfft(frames, axis=1)))
+    edges = np.round(np.geomspace(300, 2000, BANDS + 1) * FRAME / RATE).astype(int)
+    energy = np.add.reduceat(spec, edges, axis=1)[:, :BANDS]
+    diff = energy[:, :-1] - energy[:, 1:]
+    bits = (diff[1:] - diff[:-1]) > 0
+    return np.packbits(bits, axis=1, bitorder='little').view('<u4').ravel().copy()
+
+
+def bit_error_rate(a, b):
+    return float(np.unpackbits(np.bitwise_xor(a, b).view(np.uint8)).sum()) / (32 * len(a))
+
+
+class FingerprintIndex:
+    """音频库的指纹索引 (SQLite)。
+
+    每帧的 32 bit 子指纹作为倒排键建 B 树索引，查询只取命中的行，不遍历整个库；
+    候选按时间偏移投票，再对齐整段比较误码率确认。
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS files (
+                fid INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT UNIQUE, size INTEGER, mtime REAL, fp BLOB)""")
+            self.db.execute("CREATE TABLE IF NOT EXISTS hashes (h INTEGER, fid INTEGER, pos INTEGER)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS hashes_h ON hashes (h)")
+
+    def _stat(self, path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime
+
+    def known(self, path):
+        with self.lock:
+            row = self.db.execute("SELECT size, mtime FROM files WHERE path=?", (os.path.abspath(path),)).fetchone()
+        try:
+            return row is not None and tuple(row) == self._stat(path)
+        except OSError:
+            return False
+
+    def get(self, path):
+        """已索引且文件没有变化时返回保存的指纹，否则返回 None"""
+        if not self.known(path): return None
+        with self.lock:
+            row = self.db.execute("SELECT fp FROM files WHERE path=?", (os.path.abspath(path),)).fetchone()
+        return np.frombuffer(row[0], dtype='<u4') if row else None
+
+    def add(self, path, fp):
+        path = os.path.abspath(path)
+        size, mtime = self._stat(path)
+        with self.lock, self.db:
+            self._remove(path)
+            cur = self.db.execute("INSERT INTO files (path, size, mtime, fp) VALUES (?, ?, ?, ?)",
+                                  (path, size, mtime, fp.tobytes()))
+            # 静音段的全 0 / 全 1 子指纹没有区分度，不进倒排表
+            self.db.executemany("INSERT INTO hashes (h, fid, pos) VALUES (?, ?, ?)",
+                                [(int(h), cur.lastrowid, i) for i, h in enumerate(fp) if 0 < h < 0xFFFFFFFF])
+
+    def _remove(self, path):
+        row = self.db.execute("SELECT fid FROM files WHERE path=?", (path,)).fetchone()
+        if not row: return
+        self.db.execute("DELETE FROM hashes WHERE fid=?", (row[0],))
+        self.db.execute("DELETE FROM files WHERE fid=?", (row[0],))
+
+    def scan(self, folder, logger=None):
+        """增量索引目录下的音频文件 (大小/修改时间没变的跳过)，并清掉已删除文件的记录，返回新索引数"""
+        with self.lock:
+            paths = [r[0] for r in self.db.execute("SELECT path FROM files")]
+        with self.lock, self.db:
+            for p in paths:
+                if not os.path.exists(p): self._remove(p)
+        added = 0
+        for root, _, names in os.walk(folder):
+            for name in names:
+                path = os.path.join(root, name)
+                if not name.lower().endswith(AUDIO_EXTS) or self.known(path): continue
+                fp = fingerprint(path)
+                if fp is None: continue
+                self.add(path, fp)
+                added += 1
+                if logger and added % 20 == 0: logger.emit(f"🧬 已索引 {added} 个文件...")
+        return added
+
+    def match(self, fp, exclude=None):
+        """返回 (路径, 误码率)；库中没有近似录音时返回 None"""
+        if fp is None or len(fp) < MIN_OVERLAP: return None
+        positions = {}
+        for i, h in enumerate(fp):
+            if 0 < h < 0xFFFFFFFF: positions.setdefault(int(h), []).append(i)
+        votes = Counter()
+        keys = list(positions)
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self.db.execute(f"SELECT h, fid, pos FROM hashes WHERE h IN ({','.join('?' * len(batch))})",
+                                       batch).fetchall()
+                for h, fid, pos in rows:
+                    for q in positions[h]:
+                        votes[(fid, pos - q)] += 1
+        exclude = os.path.abspath(exclude) if exclude else None
+        best = None
+        for (fid, offset), n in votes.most_common(5):
+            if n < 2: break
+            with self.lock:
+                path, blob = self.db.execute("SELECT path, fp FROM files WHERE fid=?", (fid,)).fetchone()
+            if path == exclude: continue
+            ref = np.frombuffer(blob, dtype='<u4')
+            # offset = 库中位置 - 查询位置
+            q0, r0 = max(0, -offset), max(0, offset)
+            n_overlap = min(len(fp) - q0, len(ref) - r0)
+            if n_overlap < MIN_OVERLAP: continue
+            ber = bit_error_rate(fp[q0:q0 + n_overlap], ref[r0:r0 + n_overlap])
+            if ber < MAX_BER and (best is None or ber < best[1]):
+                best = (path, ber)
+        return best
+
+    def close(self):
+        with self.lock:
+            self.db.close()
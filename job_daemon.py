@@ -0,0 +1,337 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from PyQt6.QtCore import Qt
+
+import prom_metrics
+from job_engine import engine
+
+try:
+    from BiliCommander import BiliWorker
+
+    HAS_BILI = True
+except ImportError:
+    BiliWorker = None
+    HAS_BILI = False
+
+try:
+    from youtube import YouTubeWorker
+
+    HAS_YT = True
+except ImportError:
+    YouTubeWorker = None
+    HAS_YT = False
+
+try:
+    from wangyiyun2 import Worker as ConvertWorker
+
+    HAS_NCM_V2 = True
+except ImportError:
+    ConvertWorker = None
+    HAS_NCM_V2 = False
+
+try:
+    from applemusicpack import PackWorker
+
+    HAS_PACKER = True
+except ImportError:
+    PackWorker = None
+    HAS_PACKER = False
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+DEFAULT_PORT = 9480
+# 每类任务同时最多跑几个；下载任务共用站点的 Cookie 与限速，默认串行
+KIND_LIMITS = {'bili': 1, 'youtube': 1, 'ncm': 1, 'pack': 1}
+DOWNLOAD_DEFAULTS = {'mode': 'both', 'album_name': '', 'auto_cookie': True, 'stream_audio': False,
+                     'split_tracks': False, 'sync': False, 'segment_encode': False}
+REQUIRED = {
+    'bili': ('url', 'save_dir'),
+    'youtube': ('url', 'save_dir'),
+    'ncm': ('files', 'save_dir'),
+    'pack': ('files', 'album_name'),
+}
+AVAILABLE = {'bili': HAS_BILI, 'youtube': HAS_YT, 'ncm': HAS_NCM_V2, 'pack': HAS_PACKER}
+
+
+def make_worker(kind, p):
+    """按任务参数构造与窗口里相同的工作线程对象 (由调用方直接执行 run())"""
+    if kind == 'bili':
+        return BiliWorker(dict(DOWNLOAD_DEFAULTS, **p))
+    if kind == 'youtube':
+        return YouTubeWorker(dict(DOWNLOAD_DEFAULTS, **p))
+    if kind == 'ncm':
+        os.makedirs(p['save_dir'], exist_ok=True)
+        return ConvertWorker(p['files'], p['save_dir'], p.get('ncmdump') or os.path.join(os.getcwd(), "ncmdump.exe"),
+                             p.get('keep_cover', True), p.get('target_fmt', 'alac'), p.get('dedupe', 'off'),
+                             p.get('segment_encode', False))
+    if kind == 'pack':
+        return PackWorker(p['files'], p['album_name'], p.get('album_artist', ''), p.get('cover_path', ''),
+                          p.get('auto_track', True), p.get('replaygain', False), p.get('check_dupes', False),
+                          p.get('library_dir', ''))
+    raise ValueError(f"未知任务类型: {kind}")
+
+
+def failures(worker):
+    """工作线程中失败的条目数：下载类取自下载统计，转换 / 打包自己计数"""
+    metrics = getattr(worker, 'metrics', None)
+    return metrics.failed_count() if metrics is not None else getattr(worker, 'failed', 0)
+
+
+def validate(job):
+    if not isinstance(job, dict): raise ValueError("请求体必须是 JSON 对象")
+    kind = job.get('kind')
+    if kind not in REQUIRED: raise ValueError(f"kind 必须是 {', '.join(REQUIRED)} 之一")
+    if not AVAILABLE[kind]: raise ValueError(f"模块不可用: {kind}")
+    params = job.get('params') or {k: v for k, v in job.items() if k != 'kind'}
+    if not isinstance(params, dict): raise ValueError("params 必须是 JSON 对象")
+    missing = [k for k in REQUIRED[kind] if not params.get(k)]
+    if missing: raise ValueError(f"缺少参数: {', '.join(missing)}")
+    if kind in ('ncm', 'pack') and not isinstance(params['files'], list):
+        raise ValueError("files 必须是路径列表")
+    return kind, params
+
+
+class JobQueue:
+    """持久化的任务队列 (SQLite)。
+
+    提交的任务先落库再执行；守护进程重启时把中断的 running 任务重新排队，
+    下载任务自身的任务日志 / 下载档案保证续跑时不会重复下载。
+    """
+
+    def __init__(self, path, limits=None):
+        self.limits = dict(KIND_LIMITS, **(limits or {}))
+        self.cond = threading.Condition()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.cond, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, params TEXT, state TEXT,
+                created REAL, started REAL, finished REAL, error TEXT)""")
+            self.db.execute("CREATE TABLE IF NOT EXISTS logs (seq INTEGER PRIMARY KEY AUTOINCREMENT, job INTEGER, "
+                            "t REAL, line TEXT)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS logs_job ON logs (job, seq)")
+            self.db.execute("UPDATE jobs SET state=?, started=NULL WHERE state=?", (QUEUED, RUNNING))
+        self.running = {}
+
+    def submit(self, kind, params):
+        with self.cond, self.db:
+            cur = self.db.execute("INSERT INTO jobs (kind, params, state, created) VALUES (?, ?, ?, ?)",
+                                  (kind, json.dumps(params, ensure_ascii=False), QUEUED, time.time()))
+            self.cond.notify_all()
+            return cur.lastrowid
+
+    def claim(self, stop):
+        """取最早的、所属类别未达并发上限的排队任务；没有时阻塞等待"""
+        with self.cond:
+            while not stop.is_set():
+                rows = self.db.execute("SELECT id, kind, params FROM jobs WHERE state=? ORDER BY id", (QUEUED,)).fetchall()
+                for row in rows:
+                    if self.running.get(row['kind'], 0) >= self.limits.get(row['kind'], 1): continue
+                    with self.db:
+                        self.db.execute("UPDATE jobs SET state=?, started=? WHERE id=?", (RUNNING, time.time(), row['id']))
+                    self.running[row['kind']] = self.running.get(row['kind'], 0) + 1
+                    return row['id'], row['kind'], json.loads(row['params'])
+                self.cond.wait(1.0)
+        return None
+
+    def complete(self, job_id, kind, state, error=None):
+        with self.cond, self.db:
+            self.db.execute("UPDATE jobs SET state=?, finished=?, error=? WHERE id=?",
+                            (state, time.time(), error, job_id))
+            self.running[kind] -= 1
+            self.cond.notify_all()
+
+    def cancel(self, job_id):
+        """只能取消还在排队的任务"""
+        with self.cond, self.db:
+            cur = self.db.execute("UPDATE jobs SET state=?, finished=? WHERE id=? AND state=?",
+                                  (CANCELLED, time.time(), job_id, QUEUED))
+            return cur.rowcount > 0
+
+    def log(self, job_id, line):
+        with self.cond, self.db:
+            self.db.execute("INSERT INTO logs (job, t, line) VALUES (?, ?, ?)", (job_id, time.time(), line))
+
+    def get(self, job_id, since=0, tail=200):
+        with self.cond:
+            row = self.db.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+            if not row: return None
+            logs = self.db.execute("SELECT seq, t, line FROM logs WHERE job=? AND seq>? ORDER BY seq DESC LIMIT ?",
+                                   (job_id, since, tail)).fetchall()
+        job = self._row(row)
+        job['log'] = [dict(r) for r in reversed(logs)]
+        return job
+
+    def list(self, state=None, limit=100):
+        sql, args = "SELECT * FROM jobs", []
+        if state:
+            sql += " WHERE state=?"
+            args.append(state)
+        with self.cond:
+            rows = self.db.execute(sql + " ORDER BY id DESC LIMIT ?", args + [limit]).fetchall()
+        return [self._row(r) for r in rows]
+
+    def _row(self, row):
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        return job
+
+    def close(self):
+        with self.cond:
+            self.db.close()
+
+
+class JobDaemon:
+    """常驻进程：HTTP 接口收任务，固定数量的执行线程从持久队列取任务，用各工具现有的工作线程逻辑执行。
+
+    工作线程对象在执行线程里创建并直接调用 run()。这里没有 Qt 事件循环，日志信号必须直连，
+    否则后期处理线程、响度线程池发出的日志会排进一个永远不处理事件的队列里丢掉。
+    """
+
+    def __init__(self, queue, workers=2, logger=print):
+        self.queue = queue
+        self.logger = logger
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.active = {}  # job_id -> 正在执行的工作线程对象
+        self.threads = [threading.Thread(target=self._loop, name=f"daemon-{i}", daemon=True)
+                        for i in range(max(1, workers))]
+
+    def start(self):
+        for t in self.threads: t.start()
+
+    def _loop(self):
+        while not self.stop.is_set():
+            job = self.queue.claim(self.stop)
+            if job is None: return
+            job_id, kind, params = job
+            self.logger(f"▶️ 任务 #{job_id} ({kind}) 开始")
+            state, error, worker = DONE, None, None
+            try:
+                worker = make_worker(kind, params)
+                signal = getattr(worker, 'log_signal', None) or worker.log
+                signal.connect(lambda line, job_id=job_id: self.queue.log(job_id, line),
+                               Qt.ConnectionType.DirectConnection)
+                with self.lock:
+                    self.active[job_id] = worker
+                worker.run()
+            except Exception as e:
+                state, error = FAILED, str(e)
+                self.queue.log(job_id, f"💥 任务异常: {e}")
+            finally:
+                with self.lock:
+                    self.active.pop(job_id, None)
+            if worker is not None and engine().cancelled(worker):
+                state = CANCELLED
+            elif state == DONE and failures(worker):
+                # run() 正常返回不代表每个条目都成功
+                state, error = FAILED, f"{failures(worker)} 个条目失败"
+            self.queue.complete(job_id, kind, state, error)
+            self.logger(f"{'✅' if state == DONE else '❌'} 任务 #{job_id} ({kind}) {state}")
+
+    def cancel(self, job_id):
+        """取消正在执行的任务：杀掉它的外部进程，工作线程处理完当前条目后停止"""
+        with self.lock:
+            worker = self.active.get(job_id)
+        if worker is None: return False
+        engine().cancel(worker)
+        return True
+
+    def shutdown(self):
+        self.stop.set()
+        with self.queue.cond:
+            self.queue.cond.notify_all()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    queue = None
+    daemon = None
+
+    def _send(self, code, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        path, _, query = self.path.partition('?')
+        args = {k: v[-1] for k, v in parse_qs(query).items()}
+        m = re.fullmatch(r'/jobs/(\d+)', path)
+        return path, (int(m.group(1)) if m else None), args
+
+    def do_GET(self):
+        path, job_id, args = self._route()
+        try:
+            limit, since = int(args.get('limit', 100)), int(args.get('since', 0))
+        except ValueError:
+            return self._send(400, {'error': 'limit / since 必须是整数'})
+        if path == '/jobs':
+            return self._send(200, self.queue.list(args.get('state'), limit))
+        if job_id is not None:
+            job = self.queue.get(job_id, since)
+            return self._send(200, job) if job else self._send(404, {'error': '任务不存在'})
+        self._send(404, {'error': '未知路径'})
+
+    def do_POST(self):
+        path, _, _ = self._route()
+        if path != '/jobs': return self._send(404, {'error': '未知路径'})
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            kind, params = validate(json.loads(self.rfile.read(length) or b'{}'))
+        except (ValueError, TypeError) as e:
+            return self._send(400, {'error': str(e)})
+        self._send(201, {'id': self.queue.submit(kind, params), 'state': QUEUED})
+
+    def do_DELETE(self):
+        _, job_id, _ = self._route()
+        if job_id is None: return self._send(404, {'error': '未知路径'})
+        if self.queue.cancel(job_id): return self._send(200, {'id': job_id, 'state': CANCELLED})
+        if self.daemon and self.daemon.cancel(job_id): return self._send(202, {'id': job_id, 'state': RUNNING})
+        self._send(409, {'error': '任务不存在或已结束'})
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MusicSuite 任务守护进程 (仅监听 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=2, help="同时执行的任务数")
+    parser.add_argument('--db', default='daemon_jobs.sqlite')
+    args = parser.parse_args()
+    queue = JobQueue(args.db)
+    daemon = JobDaemon(queue, args.workers)
+    daemon.start()
+    prom_metrics.start()
+    _Handler.queue = queue
+    _Handler.daemon = daemon
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), _Handler)
+    server.daemon_threads = True
+    print(f"🛰️ 任务守护进程已启动: http://127.0.0.1:{args.port}/jobs (执行线程 {args.workers})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.shutdown()
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import os
+import weakref
+import asyncio
+import threading
+import subprocess
+from concurrent.futures import CancelledError
+from contextlib import contextmanager, suppress
+
+from stall_watchdog import CHECK_INTERVAL, STALL_RETRIES, ProcessStalled, Progress, output_path, record, watch
+
+# 每类外部程序的并发上限；探测类任务很轻，可以同时跑很多
+LIMITS = {
+    'ffmpeg': os.cpu_count() or 2,
+    'probe': 64,
+    'ncmdump': 2,
+    'node': 2,
+}
+
+
+def startupinfo():
+    if not hasattr(subprocess, 'STARTUPINFO'): return {}
+    # 隐藏窗口运行
+    si = subprocess.STARTUPINFO()
+    si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return {'startupinfo': si}
+
+
+class JobEngine:
+    """共享的 asyncio 子进程引擎。
+
+    事件循环跑在一个后台线程里，ffmpeg / ffprobe / ncmdump 等命令行用 create_subprocess_exec 启动，
+    按类别用信号量限流，几百个探测任务也只占一个线程。超时或取消时立即 kill 子进程。
+    QThread 里的旧代码用 run() / map() 同步调用。
+
+    任务按 group (通常是工作线程对象) 归组：工作线程用 bound(self) 把本线程的调用都归到自己名下，
+    cancel(group) 杀掉该组正在跑的子进程，之后该组再提交的命令直接抛 CancelledError。
+    """
+
+    def __init__(self, limits=None):
+        self.limits = dict(LIMITS, **(limits or {}))
+        self.sems = {}
+        self.lock = threading.Lock()
+        self.groups = {}
+        self.procs = {}  # group -> 直接用 Popen 启动、由 watch() 登记的进程
+        self.cancelled_groups = weakref.WeakSet()
+        self.local = threading.local()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="job-engine", daemon=True)
+        self.thread.start()
+
+    def _sem(self, pool):
+        # 只在事件循环线程里调用，不需要加锁
+        if pool not in self.sems:
+            self.sems[pool] = asyncio.Semaphore(self.limits.get(pool, 4))
+        return self.sems[pool]
+
+    async def exec(self, cmd, pool='ffmpeg', timeout=None, input=None, text=False, check=False, stall=None):
+        """协程版 subprocess.run：返回 CompletedProcess，超时抛 TimeoutExpired。
+
+        子进程持续 stall 秒 (默认按类别) 没有任何进展时杀掉重试，重试用完抛 ProcessStalled，
+        调用方按普通失败处理，批处理继续下一个。
+        """
+        retries = STALL_RETRIES.get(pool, 0)
+        for attempt in range(retries + 1):
+            try:
+                out, err, code = await self._attempt(cmd, pool, timeout, input, stall)
+                break
+            except ProcessStalled as e:
+                record(pool, cmd, e.idle, 'skip' if attempt == retries else 'retry')
+                if attempt == retries: raise
+        if text:
+            out, err = out.decode('utf-8', 'replace'), err.decode('utf-8', 'replace')
+        if check and code:
+            raise subprocess.CalledProcessError(code, cmd, out, err)
+        return subprocess.CompletedProcess(cmd, code, out, err)
+
+    async def _attempt(self, cmd, pool, timeout, input, stall):
+        async with self._sem(pool):
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, **startupinfo())
+            # 读到输出、输出文件变大、CPU 时间增长都算进展
+            progress = Progress(proc.pid, pool, output_path(cmd) if pool == 'ffmpeg' else None, stall)
+            out, err = [], []
+
+            async def pump(stream, buf):
+                while True:
+                    data = await stream.read(65536)
+                    if not data: return
+                    buf.append(data)
+                    progress.touch()
+
+            async def feed():
+                if input is None: return
+                with suppress(BrokenPipeError, ConnectionResetError):
+                    proc.stdin.write(input)
+                    await proc.stdin.drain()
+                    proc.stdin.close()
+
+            task = asyncio.gather(pump(proc.stdout, out), pump(proc.stderr, err), feed(), proc.wait())
+            deadline = None if timeout is None else self.loop.time() + timeout
+            try:
+                while True:
+                    done, _ = await asyncio.wait({task}, timeout=CHECK_INTERVAL)
+                    if done:
+                        task.result()
+                        break
+                    if deadline is not None and self.loop.time() >= deadline:
+                        raise subprocess.TimeoutExpired(cmd, timeout)
+                    idle = progress.stalled()
+                    if idle is not None: raise ProcessStalled(pool, cmd, idle)
+            finally:
+                # 超时、卡死、取消都会走到这里，子进程不留到后台
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+                if not task.done():
+                    task.cancel()
+                    with suppress(asyncio.CancelledError, Exception):
+                        await task
+        return b''.join(out), b''.join(err), proc.returncode
+
+    def _group(self, group):
+        return group if group is not None else getattr(self.local, 'group', None)
+
+    @contextmanager
+    def bound(self, group):
+        """当前线程里没有显式指定 group 的调用都归到 group 名下"""
+        prev = getattr(self.local, 'group', None)
+        self.local.group = group
+        try:
+            yield
+        finally:
+            self.local.group = prev
+
+    def cancelled(self, group=None):
+        return self._group(group) in self.cancelled_groups
+
+    def submit(self, coro, group=None):
+        """从任意线程提交协程，返回 concurrent.futures.Future；cancel() 会取消任务并杀掉子进程"""
+        group = self._group(group)
+        if self.cancelled(group):
+            coro.close()
+            raise CancelledError("任务已取消")
+        fut = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        with self.lock:
+            self.groups.setdefault(group, set()).add(fut)
+        fut.add_done_callback(lambda f: self._forget(group, f))
+        return fut
+
+    def _forget(self, group, fut):
+        with self.lock:
+            jobs = self.groups.get(group)
+            if jobs is None: return
+            jobs.discard(fut)
+            if not jobs: del self.groups[group]
+
+    def run(self, cmd, group=None, **kw):
+        """同步调用 (给 QThread 里的旧代码)，用法同 subprocess.run，但受并发上限约束"""
+        return self.submit(self.exec(cmd, **kw), group).result()
+
+    def map(self, cmds, group=None, **kw):
+        """并发执行一批命令，按顺序返回 CompletedProcess 或异常"""
+        async def gather():
+            return await asyncio.gather(*(self.exec(c, **kw) for c in cmds), return_exceptions=True)
+        return self.submit(gather(), group).result()
+
+    @contextmanager
+    def watch(self, proc, tool, cmd, output=None):
+        """直接用 Popen 流式读取的进程：卡死检测，并登记到当前 group，取消时一起杀掉"""
+        group = self._group(None)
+        with self.lock:
+            self.procs.setdefault(group, set()).add(proc)
+        try:
+            if self.cancelled(group): proc.kill()
+            with watch(proc, tool, cmd, output) as progress:
+                yield progress
+        finally:
+            with self.lock:
+                procs = self.procs.get(group)
+                if procs is not None:
+                    procs.discard(proc)
+                    if not procs: del self.procs[group]
+        # 被杀掉的进程读到的是 EOF，不能当成正常结束
+        if self.cancelled(group): raise CancelledError("任务已取消")
+
+    def cancel(self, group):
+        """取消 group 的全部任务并杀掉子进程；之后该组的新命令直接失败，工作线程据此停止"""
+        with suppress(TypeError):
+            self.cancelled_groups.add(group)
+        with self.lock:
+            jobs = list(self.groups.get(group, ()))
+            procs = list(self.procs.get(group, ()))
+        for fut in jobs:
+            fut.cancel()
+        for proc in procs:
+            with suppress(OSError):
+                proc.kill()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def engine():
+    """进程内共享的引擎 (首次使用时启动)"""
+    global _engine
+    with _engine_lock:
+        if _engine is None: _engine = JobEngine()
+    return _engine
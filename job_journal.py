@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+PENDING = 'pending'
+DOWNLOADING = 'downloading'
+DOWNLOADED = 'downloaded'
+POSTPROCESSED = 'postprocessed'
+FAILED = 'failed'
+
+# 增量同步记住每个列表最新的多少条 ID (最新的几条被移出收藏后仍能找到同步点)
+SYNC_KEEP = 200
+# 失败的条目跟着之后的同步重试几次；失效 / 被删的视频次次失败，超过次数就放弃
+SYNC_RETRIES = 5
+# 后期处理需要的 info 字段，只存这些避免把完整 info 写进数据库
+INFO_KEYS = ['id', 'title', 'uploader', 'extractor_key', 'ext', 'webpage_url', 'acodec', 'asr', 'video_path', 'duration', 'chapters']
+
+
+def compact_info(info):
+    return {k: info.get(k) for k in INFO_KEYS if info.get(k) is not None}
+
+
+def entry_key(entry, idx):
+    """条目在任务内的身份：提取器 + ID，没有 ID 时退回 URL；列表变化后位置会变，身份不变"""
+    vid = entry.get('id')
+    if vid: return f"{entry.get('ie_key') or entry.get('extractor_key') or ''}:{vid}"
+    return entry.get('url') or entry.get('webpage_url') or f"#{idx}"
+
+
+class JobJournal:
+    """SQLite 任务日志，记录列表下载中每个条目的状态与尝试次数。
+
+    程序崩溃或被关闭后，同一个 URL + 模式 的未完成任务可以跳过侦察，
+    从中断处继续：未下载的重新下载 (yt-dlp 会续传 .part)，已下载未后期处理的只补跑后期处理。
+    """
+
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder: os.makedirs(folder, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT, mode TEXT,
+                created REAL, finished INTEGER DEFAULT 0, recon_done INTEGER DEFAULT 0)""")
+            cols = [r['name'] for r in self.db.execute("PRAGMA table_info(entries)")]
+            if cols and 'entry_key' not in cols:
+                # 旧版按 (job_id, idx) 建主键，列表变化后续跑会错位；重建为按条目身份
+                self.db.execute("ALTER TABLE entries RENAME TO entries_v1")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                job_id INTEGER, entry_key TEXT, idx INTEGER, url TEXT, title TEXT, vid TEXT, ie_key TEXT,
+                state TEXT, attempts INTEGER DEFAULT 0, source_path TEXT, base TEXT, info TEXT,
+                PRIMARY KEY (job_id, entry_key))""")
+            if cols and 'entry_key' not in cols:
+                self.db.execute("""INSERT OR IGNORE INTO entries SELECT job_id,
+                    CASE WHEN vid IS NOT NULL AND vid != '' THEN COALESCE(ie_key, '') || ':' || vid
+                         ELSE COALESCE(url, '#' || idx) END,
+                    idx, url, title, vid, ie_key, state, attempts, source_path, base, info FROM entries_v1""")
+                self.db.execute("DROP TABLE entries_v1")
+            self.db.execute("CREATE TABLE IF NOT EXISTS sync_state (url TEXT PRIMARY KEY, seen TEXT, updated REAL, retry TEXT)")
+            cols = [r['name'] for r in self.db.execute("PRAGMA table_info(jobs)")]
+            if 'recon_done' not in cols:
+                self.db.execute("ALTER TABLE jobs ADD COLUMN recon_done INTEGER DEFAULT 1")
+
+    def open_job(self, url, mode):
+        """返回 (job_id, 是否为续跑)"""
+        with self.lock, self.db:
+            # 侦察失败留下的空任务不算可续跑
+            row = self.db.execute("SELECT job_id FROM jobs j WHERE url=? AND mode=? AND finished=0 AND "
+                                  "EXISTS (SELECT 1 FROM entries e WHERE e.job_id=j.job_id) "
+                                  "ORDER BY job_id DESC LIMIT 1", (url, mode)).fetchone()
+            if row: return row['job_id'], True
+            cur = self.db.execute("INSERT INTO jobs (url, mode, created) VALUES (?, ?, ?)", (url, mode, time.time()))
+            return cur.lastrowid, False
+
+    def add_entries(self, job_id, entries, start=0):
+        """按身份登记条目：已有的条目保留原状态，只更新在列表中的位置"""
+        rows = []
+        for i, e in enumerate(entries, start):
+            rows.append((job_id, entry_key(e, i), i, e.get('url') or e.get('webpage_url'), e.get('title'),
+                         e.get('id'), e.get('ie_key') or e.get('extractor_key'), PENDING))
+        with self.lock, self.db:
+            self.db.executemany("INSERT INTO entries (job_id, entry_key, idx, url, title, vid, ie_key, state) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                                "ON CONFLICT (job_id, entry_key) DO UPDATE SET idx=excluded.idx", rows)
+
+    def add_entry(self, job_id, idx, entry):
+        """流式侦察时逐条登记，返回日志中的条目 (续跑时保留原有状态)"""
+        self.add_entries(job_id, [entry], start=idx)
+        with self.lock:
+            row = self.db.execute("SELECT * FROM entries WHERE job_id=? AND entry_key=?",
+                                  (job_id, entry_key(entry, idx))).fetchone()
+        return self._row(row, job_id)
+
+    def entries(self, job_id):
+        with self.lock:
+            rows = self.db.execute("SELECT * FROM entries WHERE job_id=? ORDER BY idx, rowid", (job_id,)).fetchall()
+        return [self._row(r, job_id) for r in rows]
+
+    def _row(self, row, job_id):
+        e = dict(row)
+        e['id'] = e.pop('vid')
+        e['info'] = json.loads(e['info']) if e['info'] else None
+        e['job_id'] = job_id
+        return e
+
+    def recon_done(self, job_id):
+        with self.lock:
+            row = self.db.execute("SELECT recon_done FROM jobs WHERE job_id=?", (job_id,)).fetchone()
+        return bool(row and row['recon_done'])
+
+    def mark_recon_done(self, job_id):
+        with self.lock, self.db:
+            self.db.execute("UPDATE jobs SET recon_done=1 WHERE job_id=?", (job_id,))
+
+    def set_state(self, entry, state, **fields):
+        if not entry or 'job_id' not in entry: return
+        sets, args = ["state=?"], [state]
+        if state == DOWNLOADING:
+            sets.append("attempts=attempts+1")
+        for k in ('source_path', 'base'):
+            if k in fields:
+                sets.append(f"{k}=?")
+                args.append(fields[k])
+        if 'info' in fields:
+            sets.append("info=?")
+            args.append(json.dumps(compact_info(fields['info']), ensure_ascii=False))
+        with self.lock, self.db:
+            self.db.execute(f"UPDATE entries SET {', '.join(sets)} WHERE job_id=? AND entry_key=?",
+                            args + [entry['job_id'], entry['entry_key']])
+        entry['state'] = state
+
+    def counts(self, job_id):
+        with self.lock:
+            rows = self.db.execute("SELECT state, COUNT(*) AS n FROM entries WHERE job_id=? GROUP BY state",
+                                   (job_id,)).fetchall()
+        return {r['state']: r['n'] for r in rows}
+
+    def finish_job(self, job_id):
+        """侦察完整且所有条目都到达终态 (后期处理完成 / 失败) 时才关闭任务，返回是否已关闭"""
+        if not self.recon_done(job_id): return False
+        c = self.counts(job_id)
+        if any(c.get(s) for s in (PENDING, DOWNLOADING, DOWNLOADED)): return False
+        with self.lock, self.db:
+            self.db.execute("UPDATE jobs SET finished=1 WHERE job_id=?", (job_id,))
+        return True
+
+    def known_ids(self, url):
+        """增量同步：上次同步时该列表最新的条目 ID"""
+        with self.lock:
+            row = self.db.execute("SELECT seen FROM sync_state WHERE url=?", (url,)).fetchone()
+        return set(json.loads(row['seen'])) if row else set()
+
+    def sync_retries(self, url):
+        """上次同步失败、等待重试的条目 (紧凑记录，可直接交给 add_entry)"""
+        with self.lock:
+            row = self.db.execute("SELECT retry FROM sync_state WHERE url=?", (url,)).fetchone()
+        return list(json.loads(row['retry']).values()) if row and row['retry'] else []
+
+    def advance_sync(self, job_id, url, keep=SYNC_KEEP, retries=SYNC_RETRIES):
+        """本次任务的条目都尝试过 (完成或失败) 时，把它们放到同步点最前面；还有未处理的条目时不前移并返回 False。
+
+        失败的条目不挡同步点，记进重试集合，下次同步时重新入队；成功后移出，连续失败 retries 次后放弃。
+        """
+        entries = self.entries(job_id)
+        if any(e['state'] not in (POSTPROCESSED, FAILED) for e in entries): return False
+        with self.lock, self.db:
+            row = self.db.execute("SELECT seen, retry FROM sync_state WHERE url=?", (url,)).fetchone()
+            retry = json.loads(row['retry']) if row and row['retry'] else {}
+            for e in entries:
+                rec = retry.pop(e['entry_key'], None)
+                if e['state'] != FAILED: continue
+                tries = (rec or {}).get('tries', 0) + 1
+                if tries < retries:
+                    retry[e['entry_key']] = {'id': e['id'], 'url': e['url'], 'title': e['title'],
+                                             'ie_key': e['ie_key'], 'tries': tries}
+            seen = [e['id'] for e in entries if e['id']] + (json.loads(row['seen']) if row else [])
+            seen = list(dict.fromkeys(seen))[:keep]
+            self.db.execute("INSERT OR REPLACE INTO sync_state (url, seen, updated, retry) VALUES (?, ?, ?, ?)",
+                            (url, json.dumps(seen), time.time(), json.dumps(retry, ensure_ascii=False)))
+        return True
+
+    def close(self):
+        with self.lock:
+            self.db.close()
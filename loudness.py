@@ -0,0 +1,141 @@
+import subprocess
+
+from job_engine import engine, startupinfo
+
+try:
+    import numpy as np
+
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+RATE = 48000
+SEGMENT = RATE // 10  # 100ms，400ms 门限块 = 4 段 (75% 重叠)
+CHUNK = RATE  # 每次从 ffmpeg 读 1 秒
+IR_LEN = 8192
+REFERENCE = -18.0  # ReplayGain 2.0 参考响度 (LUFS)
+ABS_GATE = -70.0
+REL_GATE = -10.0
+# ITU-R BS.1770 K 加权 (48kHz)：高架滤波 + RLB 高通
+_SHELF = ([1.53512485958697, -2.69169618940638, 1.19839281085285], [1.0, -1.69065929318241, 0.73248077421585])
+_RLB = ([1.0, -2.0, 1.0], [1.0, -1.99004745483398, 0.99007225036621])
+
+_kernel = None
+
+
+def _biquad(x, coeffs):
+    (b0, b1, b2), (_, a1, a2) = coeffs
+    y, x1, x2, y1, y2 = [], 0.0, 0.0, 0.0, 0.0
+    for v in x:
+        out = b0 * v + b1 * x1 + b2 * x2 - a1 * y1 - a2 * y2
+        x2, x1, y2, y1 = x1, v, y1, out
+        y.append(out)
+    return y
+
+
+def _impulse():
+    # K 加权的冲激响应只算一次；8192 点时尾部已衰减到 -300dB 以下，按 FIR 处理误差可忽略
+    global _kernel
+    if _kernel is None:
+        _kernel = np.array(_biquad(_biquad([1.0] + [0.0] * (IR_LEN - 1), _SHELF), _RLB))
+    return _kernel
+
+
+class KWeighting:
+    """分块的 K 加权滤波 (FFT 重叠相加)，整块向量化，不逐样本循环"""
+
+    def __init__(self, channels, chunk=CHUNK):
+        self.n = 1 << (chunk + IR_LEN - 2).bit_length()
+        self.H = np.fft.rfft(_impulse(), self.n)[:, None]
+        self.tail = np.zeros((IR_LEN - 1, channels))
+
+    def __call__(self, x):
+        y = np.fft.irfft(np.fft.rfft(x, self.n, axis=0) * self.H, self.n, axis=0)[:len(x) + IR_LEN - 1]
+        y[:IR_LEN - 1] += self.tail
+        self.tail = y[len(x):].copy()
+        return y[:len(x)]
+
+
+class TrackLoudness:
+    def __init__(self, path, blocks, peak):
+        self.path = path
+        self.blocks = blocks
+        self.peak = peak
+        self.lufs = integrated(blocks)
+
+    @property
+    def gain(self):
+        return None if self.lufs is None else REFERENCE - self.lufs
+
+
+def _lufs(energy):
+    return -0.691 + 10 * np.log10(np.maximum(energy, 1e-20))
+
+
+def integrated(blocks):
+    """BS.1770 门限积分响度：-70 LUFS 绝对门限 + 相对 -10 LU 门限"""
+    if blocks is None or not len(blocks): return None
+    b = blocks[_lufs(blocks) > ABS_GATE]
+    if not len(b): return None
+    b = b[_lufs(b) > _lufs(b.mean()) + REL_GATE]
+    return float(_lufs(b.mean()))
+
+
+def album_loudness(tracks):
+    """专辑响度：把各曲目的门限块合在一起重新门限，不需要再次解码"""
+    blocks = [t.blocks for t in tracks if t.blocks is not None and len(t.blocks)]
+    if not blocks: return None, 0.0
+    lufs = integrated(np.concatenate(blocks))
+    return lufs, max(t.peak for t in tracks)
+
+
+def analyze(path, channels=2):
+    """用 ffmpeg 流式解码为 48kHz float PCM，边读边做 K 加权与分段能量统计"""
+    ch = max(1, min(int(channels or 2), 2))
+    cmd = ['ffmpeg', '-v', 'error', '-i', path, '-map', '0:a:0', '-ac', str(ch), '-ar', str(RATE),
+           '-f', 'f32le', '-']
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, **startupinfo())
+    kw = KWeighting(ch)
+    frame = ch * 4
+    segments, rest, peak = [], np.zeros(0), 0.0
+    try:
+        with engine().watch(proc, 'ffmpeg', cmd) as progress:
+            while True:
+                raw = proc.stdout.read(CHUNK * frame)
+                if not raw: break
+                progress.touch()
+                x = np.frombuffer(raw[:len(raw) // frame * frame], dtype='<f4').reshape(-1, ch).astype(np.float64)
+                if not len(x): continue
+                peak = max(peak, float(np.abs(x).max()))
+                # L/R 声道权重都是 1，直接对声道求和
+                e = np.concatenate([rest, np.square(kw(x)).sum(axis=1)])
+                whole = len(e) // SEGMENT * SEGMENT
+                segments.append(e[:whole].reshape(-1, SEGMENT).mean(axis=1))
+                rest = e[whole:]
+    finally:
+        proc.stdout.close()
+        proc.wait()
+    seg = np.concatenate(segments) if segments else np.zeros(0)
+    # 不完整的 400ms 块按规范丢弃
+    blocks = (seg[:-3] + seg[1:-2] + seg[2:-1] + seg[3:]) / 4 if len(seg) >= 4 else np.zeros(0)
+    return TrackLoudness(path, blocks, peak)
+
+
+def itunnorm(gain, peak):
+    """Sound Check 的 iTunNORM 字符串 (10 个十六进制字段)"""
+    g1 = min(round(1000 * 10 ** (-gain / 10)), 65534)
+    g2 = min(round(2500 * 10 ** (-gain / 10)), 65534)
+    p = min(round(peak * 32768), 32768)
+    return "".join(f" {v:08X}" for v in (g1, g1, g2, g2, 0, 0, p, p, 0, 0))
+
+
+def replaygain_tags(track, album_lufs=None, album_peak=None):
+    """ReplayGain 2.0 标签 (小写键，写入时按格式转换)"""
+    tags = {
+        'replaygain_track_gain': f"{track.gain:+.2f} dB",
+        'replaygain_track_peak': f"{track.peak:.6f}",
+    }
+    if album_lufs is not None:
+        tags['replaygain_album_gain'] = f"{REFERENCE - album_lufs:+.2f} dB"
+        tags['replaygain_album_peak'] = f"{album_peak:.6f}"
+    return tags
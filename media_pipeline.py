@@ -0,0 +1,46 @@
+import queue
+import threading
+
+_STOP = object()
+
+
+class PostProcessPipeline:
+    """下载 -> 后期处理 的生产者/消费者流水线。
+
+    下载线程调用 submit() 把已落盘的任务放进有界队列，独立的后期处理线程池
+    (ffmpeg 等) 从队列取任务。队列满时 submit() 阻塞，形成背压，
+    避免下载远快于转码时临时文件堆满磁盘。close() 会等待所有任务处理完毕。
+    """
+
+    def __init__(self, handler, workers=2, max_pending=2, logger=None):
+        self.handler = handler
+        self.logger = logger
+        self.jobs = queue.Queue(maxsize=max(1, max_pending))
+        self.threads = []
+        for i in range(max(1, workers)):
+            t = threading.Thread(target=self._loop, name=f"postproc-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def submit(self, *job):
+        if self.logger and self.jobs.full():
+            self.logger.emit("⏳ 后期处理队列已满，等待空位...")
+        self.jobs.put(job)
+
+    def _loop(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is _STOP: return
+                self.handler(*job)
+            except Exception as e:
+                if self.logger: self.logger.emit(f"💥 后期处理异常: {e}")
+            finally:
+                self.jobs.task_done()
+
+    def close(self):
+        # 每个消费者一个哨兵，排在已有任务之后，保证队列先被清空
+        for _ in self.threads:
+            self.jobs.put(_STOP)
+        for t in self.threads:
+            t.join()
@@ -0,0 +1,107 @@
+import os
+
+COVER_EXTS = ['.jpg', '.png', '.webp']
+# ipod 容器可以直接装下的音频编码
+COPY_CODECS = ('mp4a', 'aac', 'alac')
+
+
+def audio_format(info):
+    """选中格式中的音轨；bestvideo+bestaudio 时在 requested_formats 里"""
+    for f in info.get('requested_formats') or []:
+        if f.get('acodec') not in (None, 'none'): return f
+    return info
+
+
+def audio_params(info):
+    """(音频编码, 采样率)，采样率未知时为 0"""
+    f = audio_format(info)
+    return (f.get('acodec') or '').lower(), int(f.get('asr') or 0)
+
+
+def find_cover(base):
+    for ext in COVER_EXTS:
+        if os.path.exists(base + ext): return base + ext
+    return None
+
+
+def split_av_formats(ctx):
+    """全都要模式的格式选择器：视频流、音频流分别下载，不让 yt-dlp 合并。
+
+    没有分离的音视频流时退回最佳的音视频合一格式。
+    """
+    formats = ctx['formats']
+    video = [f for f in formats if f.get('vcodec') != 'none' and f.get('acodec') == 'none']
+    audio = [f for f in formats if f.get('acodec') != 'none' and f.get('vcodec') == 'none']
+    if video and audio:
+        yield video[-1]
+        yield audio[-1]
+        return
+    muxed = [f for f in formats if f.get('vcodec') != 'none' and f.get('acodec') != 'none']
+    if muxed or formats: yield (muxed or formats)[-1]
+
+
+def split_paths(ydl, info):
+    """split_av_formats 选中的 (视频文件, 音频文件, 音频格式)，合一格式时两者是同一个文件"""
+    picks = list(split_av_formats({'formats': info.get('formats') or [info]}))
+    paths = [ydl.prepare_filename({**info, **f}) for f in picks]
+    return paths[0], paths[-1], picks[-1]
+
+
+def _ffmpeg():
+    return ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error']
+
+
+def plan_audio(source, out, sample_rate, cover=None, metadata=None, acodec=''):
+    """拼出生成带标签 .m4a 的单条 ffmpeg 命令，返回 (命令, 说明, 'copy'/'encode')。
+
+    采样率直接取自 info，不再单独跑 ffprobe；封面用 yt-dlp 下载的原始 webp/jpg，
+    在同一个进程里解码并编码成 mjpeg 内嵌，不再需要 FFmpegThumbnailsConvertor。
+    源音轨已经是 AAC/ALAC 时直接流复制，只有编码或容器不兼容时才转码。
+    """
+    cmd = _ffmpeg() + ['-i', source]
+    if cover: cmd.extend(['-i', cover])
+    args, label, action = _audio_output('0:a', '1:v:0' if cover else None, out, sample_rate, metadata, acodec)
+    return cmd + args, label, action
+
+
+def plan_split(video, audio, mp4_out, m4a_out, sample_rate, cover=None, metadata=None, acodec=''):
+    """全都要模式：一次读取分开下载的视频流和音频流，同时输出 mp4 (流复制合并) 和带标签的 m4a。
+
+    m4a_out 为 None 时只合并 mp4。返回值同 plan_audio。
+    """
+    cmd = _ffmpeg() + ['-i', video]
+    a_in = 0
+    if audio != video:
+        cmd.extend(['-i', audio])
+        a_in = 1
+    if cover and m4a_out: cmd.extend(['-i', cover])
+    # 与 yt-dlp 合并时一样直接流复制；FLAC/Opus 放进 mp4 在旧版 ffmpeg 中需要 experimental
+    cmd.extend(['-map', '0:v:0', '-map', f'{a_in}:a:0', '-c', 'copy', '-strict', 'experimental', '-f', 'mp4', mp4_out])
+    if not m4a_out: return cmd, "🎞️ 合并视频", None
+    args, label, action = _audio_output(f'{a_in}:a:0', f'{a_in + 1}:v:0' if cover else None,
+                                        m4a_out, sample_rate, metadata, acodec)
+    return cmd + args, label, action
+
+
+def audio_codec(sample_rate, acodec=''):
+    """音轨的编码参数，返回 (参数列表, 说明, 'copy'/'encode')"""
+    if acodec.startswith(COPY_CODECS):
+        return ['-c:a', 'copy'], f"⚡ {acodec} 直通 (不转码)", 'copy'
+    if acodec == 'flac':
+        # ipod 容器装不下 FLAC，无损转成 ALAC，保留原位深
+        return ['-c:a', 'alac'], "💎 Hi-Res FLAC -> ALAC (无损)", 'encode'
+    # >48kHz 使用 ALAC s32p
+    if sample_rate > 48000:
+        return ['-c:a', 'alac', '-sample_fmt', 's32p'], "💎 Hi-Res -> ALAC (32-bit)", 'encode'
+    return ['-c:a', 'aac', '-b:a', '320k', '-ac', '2'], "💿 标准 -> AAC 320k", 'encode'
+
+
+def _audio_output(audio_map, cover_map, out, sample_rate, metadata, acodec):
+    cmd = ['-map', audio_map]
+    if cover_map: cmd.extend(['-map', cover_map, '-c:v:0', 'mjpeg', '-disposition:v:0', 'attached_pic'])
+    codec, label, action = audio_codec(sample_rate, acodec)
+    cmd.extend(codec)
+    for k, v in (metadata or {}).items():
+        cmd.extend(['-metadata', f'{k}={v}'])
+    cmd.extend(['-f', 'ipod', out])
+    return cmd, label, action
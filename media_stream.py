@@ -0,0 +1,118 @@
+import os
+import time
+import shutil
+import subprocess
+from urllib.parse import urlparse
+
+from yt_dlp.networking import Request
+from yt_dlp.networking.exceptions import HTTPError
+
+from job_engine import engine, startupinfo
+from media_plan import COVER_EXTS
+from stall_watchdog import output_path
+
+# 只有单个 http(s) URL 的音轨能直接灌进 ffmpeg；DASH 分片、m3u8 等走文件模式
+STREAM_PROTOCOLS = ('http', 'https')
+# 不依赖随机访问、能从管道解封装的容器；普通 MP4 的 moov 可能在末尾，管道里读不到
+PIPE_EXTS = ('webm', 'weba', 'ogg', 'opus', 'mp3', 'aac', 'flac', 'mka')
+# 音轨一律是分片 MP4 (DASH m4s) 但格式里没有 container 字段的站点
+FRAGMENTED_EXTRACTORS = ('BiliBili',)
+# 核对流式输出的时长允许的误差 (秒，或时长的 1%)
+DURATION_TOLERANCE = 2.0
+
+
+def pipe_demuxable(fmt):
+    if (fmt.get('ext') or '').lower() in PIPE_EXTS: return True
+    # YouTube 的单独音轨标为 m4a_dash / webm_dash，都是分片容器
+    if str(fmt.get('container') or '').endswith('_dash'): return True
+    return (fmt.get('extractor_key') or '').startswith(FRAGMENTED_EXTRACTORS)
+
+
+def streamable(fmt):
+    return (bool(fmt.get('url')) and fmt.get('protocol') in STREAM_PROTOCOLS
+            and fmt.get('vcodec') in (None, 'none') and pipe_demuxable(fmt))
+
+
+def verify_output(path, duration=None):
+    """ffmpeg 读不全管道输入时可能只记一条 partial file 就正常退出；改名前用 ffprobe 核对时长与大小，不对就抛异常"""
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of',
+           'default=noprint_wrappers=1:nokey=1', path]
+    res = engine().run(cmd, pool='probe', timeout=30, text=True)
+    try:
+        got = float(res.stdout.strip())
+    except ValueError:
+        raise ValueError(f"输出不完整: {size} 字节，时长未知")
+    # 最低按 8kbps 估算，远小于此说明只写出了文件头
+    if not size or (duration and size < duration * 1000):
+        raise ValueError(f"输出不完整: {size} 字节")
+    if duration and abs(got - duration) > max(DURATION_TOLERANCE, duration * 0.01):
+        raise ValueError(f"输出时长 {got:.1f}s 与源 {duration:.1f}s 不符")
+    return got
+
+
+def fetch_thumbnail(ydl, info, base):
+    """流式模式没有 yt-dlp 的 writethumbnail，自己取一次封面原图"""
+    url = info.get('thumbnail')
+    if not url: return None
+    ext = os.path.splitext(urlparse(url).path)[1].lower()
+    path = base + (ext if ext in COVER_EXTS else '.jpg')
+    try:
+        with ydl.urlopen(url) as res, open(path, 'wb') as f:
+            shutil.copyfileobj(res, f)
+        return path
+    except Exception:
+        return None
+
+
+def stream_into(ydl, fmt, cmd, hook=None, chunk=256 * 1024):
+    """边下边编码：把 fmt 的字节流写进 ffmpeg 的 stdin (cmd 的输入为 pipe:0)。
+
+    请求走 ydl.urlopen，沿用会话的 Cookie、限速与格式自带的请求头；
+    格式要求分段请求 (http_chunk_size) 时按 Range 逐段拉取。
+    ffmpeg 加 -xerror，遇到无法从管道解析的数据即非零退出并抛出异常，由调用方回退到文件模式；
+    ffmpeg 正常退出也不代表输出完整，调用方改名前还要 verify_output。
+    返回写入的字节数。
+    """
+    cmd = [cmd[0], '-xerror'] + list(cmd[1:])
+    seg = (fmt.get('downloader_options') or {}).get('http_chunk_size')
+    total = fmt.get('filesize') or fmt.get('filesize_approx')
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, **startupinfo())
+    t0 = time.monotonic()
+    pos = 0
+    try:
+        with engine().watch(proc, 'ffmpeg', cmd, output_path(cmd)) as progress:
+            while True:
+                headers = dict(fmt.get('http_headers') or {})
+                if seg: headers['Range'] = f"bytes={pos}-{pos + seg - 1}"
+                try:
+                    res = ydl.urlopen(Request(fmt['url'], headers=headers))
+                except HTTPError as e:
+                    # 文件大小恰好是分段的整数倍时，最后一次请求会越界
+                    if seg and pos and e.status == 416: break
+                    raise
+                got = 0
+                with res:
+                    while True:
+                        buf = res.read(chunk)
+                        if not buf: break
+                        proc.stdin.write(buf)
+                        progress.touch()
+                        got += len(buf)
+                        pos += len(buf)
+                        if hook:
+                            hook({'status': 'downloading', 'downloaded_bytes': pos, 'total_bytes': total,
+                                  'elapsed': time.monotonic() - t0, 'info_dict': fmt})
+                if not seg or got < seg or (total and pos >= total): break
+            proc.stdin.close()
+            proc.wait()
+    except Exception:
+        proc.kill()
+        proc.wait()
+        raise
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    if hook:
+        hook({'status': 'finished', 'downloaded_bytes': pos, 'total_bytes': pos,
+              'elapsed': time.monotonic() - t0, 'info_dict': fmt})
+    return pos
@@ -0,0 +1,42 @@
+def compact_entry(e, fallback_url=None):
+    """只保留下载需要的字段，避免整页 info 常驻内存"""
+    return {
+        'id': e.get('id'),
+        'url': e.get('url') if e.get('_type') in ('url', 'url_transparent') else (e.get('webpage_url') or e.get('url') or fallback_url),
+        'title': e.get('title'),
+        'ie_key': e.get('ie_key') or e.get('extractor_key'),
+    }
+
+
+def _iter_raw(entries):
+    # PagedList 按页惰性取数据；普通 list / generator 直接迭代
+    getslice = getattr(entries, '_getslice', None)
+    if getslice: return getslice(0, None)
+    return iter(entries)
+
+
+def iter_entries(ydl, url, max_redirects=5):
+    """流式侦察：逐条产出紧凑记录 {'id', 'url', 'title', 'ie_key'}。
+
+    使用 process=False 拿到未展开的结果，entries 保持为生成器 / 分页列表，
+    第一条记录产出时后面的页还没有请求，调用方可以边侦察边下载。
+    """
+    info = ydl.extract_info(url, download=False, process=False)
+    # 短链 / 跳转：继续解析直到拿到真正的结果
+    for _ in range(max_redirects):
+        if not info or info.get('_type') not in ('url', 'url_transparent'): break
+        info = ydl.extract_info(info['url'], ie_key=info.get('ie_key'), download=False, process=False)
+    if not info: return
+    yield from _walk(info, url)
+
+
+def _walk(info, url):
+    if info.get('_type') in ('playlist', 'multi_video'):
+        for e in _iter_raw(info.get('entries') or []):
+            if e is None: continue
+            if e.get('_type') in ('playlist', 'multi_video'):
+                yield from _walk(e, url)
+            else:
+                yield compact_entry(e)
+    else:
+        yield compact_entry(info, url)
@@ -0,0 +1,163 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 设置端口 (例如 9477) 后开启，只监听 127.0.0.1；未设置时所有计数照常累加但不对外提供
+PORT_ENV = 'MUSICSUITE_METRICS_PORT'
+BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _fmt(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, registry, name, help, labels=()):
+        self.lock = registry.lock
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(l, '')) for l in self.labels)
+
+    def _series(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs: return ''
+        return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{self._series(key)} {_fmt(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount <= 0: return
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labels=(), buckets=BUCKETS):
+        super().__init__(registry, name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            # [各桶计数..., 总和, 总数]，桶按上界累计
+            h = self.values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, le in enumerate(self.buckets):
+                if value <= le: h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, h in sorted(self.values.items()):
+            for le, n in zip(self.buckets, h):
+                lines.append(f"{self.name}_bucket{self._series(key, [('le', _fmt(le))])} {n}")
+            lines.append(f"{self.name}_bucket{self._series(key, [('le', '+Inf')])} {h[-1]}")
+            lines.append(f"{self.name}_sum{self._series(key)} {_fmt(h[-2])}")
+            lines.append(f"{self.name}_count{self._series(key)} {h[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(self, name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(self, name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=BUCKETS):
+        return self._add(Histogram(self, name, help, labels, buckets))
+
+    def render(self):
+        """Prometheus 文本格式 (0.0.4)"""
+        with self.lock:
+            lines = [l for m in self.metrics for l in m.render()]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+JOBS = REGISTRY.counter('musicsuite_jobs_total', '按结果统计的任务数 (ok / failed / skipped)', ('tool', 'state'))
+JOBS_ACTIVE = REGISTRY.gauge('musicsuite_jobs_active', '正在处理的任务数', ('tool',))
+BYTES = REGISTRY.counter('musicsuite_downloaded_bytes_total', '下载的字节数', ('tool',))
+ENCODE_SECONDS = REGISTRY.histogram('musicsuite_encode_seconds', '单个任务的转码 / 后期处理耗时', ('tool',))
+PROBE_CACHE = REGISTRY.counter('musicsuite_probe_cache_total',
+                               '采样率查询: 命中已知信息 (hit)、取自批量预探测 (prefetch) 或单独调用 ffprobe (miss)',
+                               ('tool', 'result'))
+COOKIE_REFRESHES = REGISTRY.counter('musicsuite_cookie_refreshes_total', '实际执行的 Cookie 刷新次数', ('result',))
+RETRIES = REGISTRY.counter('musicsuite_retries_total', 'yt-dlp 报告的重试次数', ('tool',))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start(port=None):
+    """启动 /metrics 服务 (进程内只启动一次，多个窗口共享)；没有配置端口或端口被占用时返回 None"""
+    global _server
+    port = port or os.environ.get(PORT_ENV)
+    if not port: return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(('127.0.0.1', int(port)), _Handler)
+            except (OSError, ValueError):
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
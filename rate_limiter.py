@@ -0,0 +1,137 @@
+import time
+import random
+import threading
+from urllib.parse import urlparse
+
+import yt_dlp
+
+THROTTLE_CODES = (403, 412, 429)
+# 被拦截的 GET / HEAD 在退避结束后重试，总共最多尝试几次
+THROTTLE_ATTEMPTS = 3
+# 只有提取器 / 接口主机走令牌桶；媒体 CDN、封面等主机不限速 (分片、分段下载请求很密)，只服从被拦截后的退避
+METERED_HOSTS = ('www.bilibili.com', 'api.bilibili.com', 'space.bilibili.com', 'b23.tv',
+                 'www.youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtubei.googleapis.com', 'youtu.be')
+
+
+class HostLimiter:
+    """单个主机的令牌桶 + 指数退避 (带抖动)。
+
+    被 403/412/429 拦截时速率减半并进入退避期，之后每次成功请求逐步恢复到基准速率。
+    """
+
+    def __init__(self, host, rate=3.0, burst=6, min_rate=0.2, base_backoff=2.0, max_backoff=120.0):
+        self.host = host
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+        self.blocked_until = 0.0
+        self.strikes = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, metered=True):
+        """metered=False 的请求不消耗令牌，只等退避结束"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if now >= self.blocked_until and (not metered or self.tokens >= 1):
+                    if metered: self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate if metered else 0)
+            time.sleep(wait)
+
+    def on_throttle(self):
+        with self.lock:
+            delay = min(self.max_backoff, self.base_backoff * (2 ** self.strikes))
+            delay *= random.uniform(0.5, 1.5)
+            self.strikes += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            self.blocked_until = time.monotonic() + delay
+            return delay
+
+    def on_success(self):
+        """返回 True 表示刚好恢复到基准速率"""
+        with self.lock:
+            if self.rate >= self.base_rate and not self.strikes: return False
+            self.strikes = max(0, self.strikes - 1)
+            self.rate = min(self.base_rate, self.rate * 1.25)
+            return self.rate >= self.base_rate and not self.strikes
+
+    def status(self):
+        backoff = max(0.0, self.blocked_until - time.monotonic())
+        text = f"{self.host}: {self.rate:.2f} req/s"
+        if backoff: text += f", 退避剩余 {backoff:.1f}s"
+        if self.strikes: text += f", 连续拦截 {self.strikes}"
+        return text
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(host):
+    """按主机共享的限速器 (侦察、元数据、媒体请求共用)"""
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = HostLimiter(host)
+        return _limiters[host]
+
+
+def throttled_hosts():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [l.status() for l in limiters if l.strikes or l.rate < l.base_rate]
+
+
+def _request_url(req):
+    if isinstance(req, str): return req
+    return getattr(req, 'url', None) or req.get_full_url()
+
+
+def _idempotent(req):
+    if isinstance(req, str): return True
+    method = getattr(req, 'method', None) or (req.get_method() if hasattr(req, 'get_method') else 'GET')
+    return method.upper() in ('GET', 'HEAD')
+
+
+class LimitedYoutubeDL(yt_dlp.YoutubeDL):
+    """经过 urlopen 的请求按主机限速：接口主机先拿令牌，所有主机被拦截时都退避并重试"""
+
+    # 额外注入的提取器类 (离线测速工具用)，优先于内置提取器匹配
+    extra_extractors = ()
+
+    def __init__(self, params=None, *args, **kwargs):
+        super().__init__(params, *args, **kwargs)
+        for ie_cls in self.extra_extractors:
+            ie = ie_cls()
+            self.add_info_extractor(ie)
+            self._ies = {ie.ie_key(): ie, **self._ies}
+
+    def urlopen(self, req):
+        host = urlparse(_request_url(req)).hostname or ''
+        limiter = limiter_for(host)
+        attempts = THROTTLE_ATTEMPTS if _idempotent(req) else 1
+        for attempt in range(1, attempts + 1):
+            # 退避期间 acquire 会一直等到解除
+            limiter.acquire(host in METERED_HOSTS)
+            try:
+                res = super().urlopen(req)
+                break
+            except Exception as e:
+                code = getattr(e, 'status', None) or getattr(e, 'code', None)
+                if code not in THROTTLE_CODES: raise
+                delay = limiter.on_throttle()
+                retry = f"，第 {attempt}/{attempts} 次重试" if attempt < attempts else ""
+                self.report_warning(f"🐢 HTTP {code}，退避 {delay:.1f}s{retry} | {limiter.status()}")
+                if attempt == attempts: raise
+        if limiter.on_success():
+            logger = self.params.get('logger')
+            if logger: logger.info(f"✅ 速率已恢复 | {limiter.status()}")
+        return res
@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import subprocess
+
+from job_engine import engine
+
+# 默认 30 分钟以上的单个文件才分段；每段至少 2 分钟
+MIN_DURATION = 1800
+MIN_SEGMENT = 120
+# 段边界对齐到 4096 样本：ALAC 的帧长，也是 AAC 帧长 1024 的整数倍
+ALIGN = 4096
+AAC_FRAME = 1024
+# ffmpeg 自带 aac 编码器的起始延迟 (priming)，第一个包解码出来是这段静音
+AAC_DELAY = 1024
+# AAC 每段前后多编码两帧，拼接时丢掉，接缝两侧的 MDCT 重叠都来自真实信号
+ROLL = 2 * AAC_FRAME
+
+
+def _ffmpeg():
+    return ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error']
+
+
+def segment_kind(codec_args):
+    """能分段并行的编码：'aac' / 'alac'，其他 (MP3 的比特池、Vorbis、FLAC 帧号) 返回 None"""
+    codec = codec_args[codec_args.index('-c:a') + 1] if '-c:a' in codec_args else None
+    return codec if codec in ('aac', 'alac') else None
+
+
+def boundaries(duration, sample_rate, workers=None):
+    """按 CPU 数切分，返回对齐后的段起点 (样本)；不值得分段时返回 None"""
+    workers = workers or os.cpu_count() or 1
+    n = min(workers, int(duration // MIN_SEGMENT))
+    if n < 2: return None
+    total = int(duration * sample_rate)
+    step = -(-total // n // ALIGN) * ALIGN
+    return [i * step for i in range(n)]
+
+
+def _adts_frames(data):
+    """ADTS 帧的 (偏移, 长度) 列表 (ffmpeg 每帧只写一个 raw block)"""
+    frames, pos = [], 0
+    while pos + 7 <= len(data):
+        if data[pos] != 0xFF or data[pos + 1] & 0xF6 != 0xF0:
+            raise ValueError(f"ADTS 同步字错误 (偏移 {pos})")
+        size = ((data[pos + 3] & 0x03) << 11) | (data[pos + 4] << 3) | (data[pos + 5] >> 5)
+        if size < 7: raise ValueError(f"ADTS 帧长错误 (偏移 {pos})")
+        frames.append((pos, size))
+        pos += size
+    return frames
+
+
+def aac_keep(k, starts):
+    """第 k 段要保留的 AAC 包 [first, last)。
+
+    包 j 解码输出本段输入的 [(j-1)*1024, j*1024)；后一段从对应边界的那个包接上，
+    前一段保留到边界之前的最后一个包，接缝处的重叠相加由两边都见过真实信号的包完成。
+    """
+    offset = starts[k] - (ROLL if k else 0)
+    first = ROLL // AAC_FRAME + 1 if k else 0
+    last = (starts[k + 1] - offset) // AAC_FRAME + 1 if k + 1 < len(starts) else None
+    return first, last
+
+
+def _segment_cmds(src, starts, sample_rate, codec_args, kind, tmp):
+    cmds, paths = [], []
+    for k, start in enumerate(starts):
+        roll = ROLL if kind == 'aac' else 0
+        begin = max(0, start - roll)
+        path = os.path.join(tmp, f"seg{k:03d}" + ('.aac' if kind == 'aac' else '.m4a'))
+        cmd = _ffmpeg() + ['-ss', f"{begin / sample_rate:.6f}", '-i', src, '-map', '0:a:0', '-vn']
+        if k + 1 < len(starts):
+            # atrim 按样本数截断，比 -t 的时间精度可靠
+            cmd.extend(['-af', f"atrim=end_sample={starts[k + 1] + roll - begin}"])
+        cmd.extend(codec_args)
+        cmd.extend(['-f', 'adts' if kind == 'aac' else 'ipod', path])
+        cmds.append(cmd)
+        paths.append(path)
+    return cmds, paths
+
+
+def _join_aac(paths, starts, joined):
+    with open(joined, 'wb') as out:
+        for k, path in enumerate(paths):
+            with open(path, 'rb') as f:
+                data = f.read()
+            first, last = aac_keep(k, starts)
+            for pos, size in _adts_frames(data)[first:last]:
+                out.write(data[pos:pos + size])
+
+
+def _final_cmd(inputs, out, kind, cover, metadata, tags_from):
+    cmd = _ffmpeg() + inputs
+    extra = []
+    for p in (cover, tags_from):
+        if p and p not in extra: extra.append(p)
+    for p in extra: cmd.extend(['-i', p])
+    cmd.extend(['-map', '0:a', '-c:a', 'copy'])
+    if kind == 'aac': cmd.extend(['-bsf:a', 'aac_adtstoasc'])
+    if cover: cmd.extend(['-map', f'{1 + extra.index(cover)}:v?', '-c:v', 'mjpeg', '-disposition:v:0', 'attached_pic'])
+    if tags_from: cmd.extend(['-map_metadata', str(1 + extra.index(tags_from))])
+    for k, v in (metadata or {}).items():
+        cmd.extend(['-metadata', f'{k}={v}'])
+    cmd.extend(['-f', 'ipod', out])
+    return cmd
+
+
+def encode_segmented(src, out, sample_rate, duration, codec_args, cover=None, metadata=None, tags_from=None,
+                     workers=None):
+    """把一个长文件按时间切段，各段用独立的 ffmpeg 并行编码 (共享引擎的 ffmpeg 并发上限)，再无损拼接成 .m4a。
+
+    ALAC：段边界按样本精确截断，帧彼此独立，concat 流复制即可逐样本还原。
+    AAC：各段多编码前后各两帧，拼接时按包丢弃，再用负的 itsoffset 让 mp4 写入编辑列表跳过起始延迟，
+    整体与单次编码一样无缝。cover 可以是图片或带封面的源文件，tags_from 指定复制全局标签的来源。
+    不值得分段时返回 False，由调用方走单进程编码。
+    """
+    kind = segment_kind(codec_args)
+    starts = boundaries(duration, sample_rate, workers) if kind and sample_rate else None
+    if not starts: return False
+    tmp = tempfile.mkdtemp(prefix='.seg_', dir=os.path.dirname(os.path.abspath(out)))
+    try:
+        cmds, paths = _segment_cmds(src, starts, sample_rate, codec_args, kind, tmp)
+        for res in engine().map(cmds, pool='ffmpeg'):
+            if isinstance(res, Exception): raise res
+            if res.returncode:
+                raise subprocess.CalledProcessError(res.returncode, res.args, res.stdout, res.stderr)
+        if kind == 'aac':
+            joined = os.path.join(tmp, 'joined.aac')
+            _join_aac(paths, starts, joined)
+            inputs = ['-itsoffset', f"-{AAC_DELAY / sample_rate:.6f}", '-f', 'aac', '-i', joined]
+        else:
+            listing = os.path.join(tmp, 'list.txt')
+            with open(listing, 'w', encoding='utf-8') as f:
+                for p in paths:
+                    f.write(f"file '{os.path.basename(p)}'\n")
+            inputs = ['-f', 'concat', '-safe', '0', '-i', listing]
+        engine().run(_final_cmd(inputs, out, kind, cover, metadata, tags_from), check=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return True
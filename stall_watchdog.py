@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+import ctypes
+import threading
+from contextlib import contextmanager
+
+from prom_metrics import REGISTRY
+
+# 多少秒没有任何进展 (输出、输出文件增长、CPU 时间) 视为卡死，按工具区分
+STALL_SECONDS = {'ffmpeg': 120, 'probe': 30, 'ncmdump': 60, 'node': 30}
+# 卡死后重试几次，仍然卡死就跳过
+STALL_RETRIES = {'ffmpeg': 1, 'probe': 1, 'ncmdump': 1, 'node': 0}
+STALL_LOG = 'stalled_jobs.jsonl'
+CHECK_INTERVAL = 1.0
+CPU_EPSILON = 0.05
+
+STALLS = REGISTRY.counter('musicsuite_stalled_processes_total', '因卡死被杀掉的子进程 (retry 重试 / skip 跳过)',
+                          ('tool', 'action'))
+_log_lock = threading.Lock()
+
+
+class ProcessStalled(Exception):
+    def __init__(self, tool, cmd, idle):
+        super().__init__(f"{tool} 已 {idle:.0f} 秒没有进展，已终止: {os.path.basename(str(cmd[0]))}")
+        self.tool = tool
+        self.cmd = cmd
+        self.idle = idle
+
+
+class _FileTime(ctypes.Structure):
+    _fields_ = [('low', ctypes.c_uint32), ('high', ctypes.c_uint32)]
+
+
+def cpu_time(pid):
+    """子进程累计的 CPU 时间 (秒)，取不到时返回 None"""
+    try:
+        if sys.platform == 'win32':
+            k32 = ctypes.windll.kernel32
+            handle = k32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+            if not handle: return None
+            try:
+                c, e, kernel, user = _FileTime(), _FileTime(), _FileTime(), _FileTime()
+                if not k32.GetProcessTimes(handle, ctypes.byref(c), ctypes.byref(e), ctypes.byref(kernel),
+                                           ctypes.byref(user)):
+                    return None
+                # FILETIME 单位 100ns
+                return sum((t.high << 32 | t.low) for t in (kernel, user)) / 1e7
+            finally:
+                k32.CloseHandle(handle)
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except Exception:
+        return None
+
+
+def output_path(cmd):
+    """ffmpeg 命令的输出文件 (最后一个参数)，输出到管道时返回 None"""
+    last = str(cmd[-1]) if cmd else ''
+    return None if last in ('-', 'pipe:', 'pipe:1') or last.startswith('pipe:') else last
+
+
+class Progress:
+    """一个子进程的进展跟踪：读到输出时 touch()，定时 stalled() 检查输出文件大小与 CPU 时间"""
+
+    def __init__(self, pid, tool, output=None, threshold=None):
+        self.pid = pid
+        self.tool = tool
+        self.output = output
+        self.threshold = threshold or STALL_SECONDS.get(tool, 120)
+        self.last = time.monotonic()
+        self.cpu = cpu_time(pid) or 0.0
+        self.size = -1
+
+    def touch(self):
+        self.last = time.monotonic()
+
+    def stalled(self):
+        """卡死时返回空闲秒数，否则返回 None"""
+        cpu = cpu_time(self.pid)
+        if cpu is not None and cpu - self.cpu > CPU_EPSILON:
+            self.cpu = cpu
+            self.touch()
+        if self.output:
+            try:
+                size = os.path.getsize(self.output)
+            except OSError:
+                size = -1
+            if size > self.size:
+                self.size = size
+                self.touch()
+        idle = time.monotonic() - self.last
+        return idle if idle >= self.threshold else None
+
+
+def record(tool, cmd, idle, action):
+    """记录被杀掉的进程 (JSONL + 指标)，无人值守的批处理结束后可以据此补跑"""
+    STALLS.inc(tool=tool, action=action)
+    entry = {'time': time.time(), 'tool': tool, 'action': action, 'idle': round(idle, 1),
+             'cmd': [str(c) for c in cmd]}
+    try:
+        with _log_lock, open(STALL_LOG, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+class _Monitor:
+    """给直接用 Popen 流式读取的调用方用的监视线程 (asyncio 引擎自己在协程里检查)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.watched = {}
+        self.thread = None
+
+    def add(self, proc, progress):
+        with self.lock:
+            self.watched[id(proc)] = (proc, progress)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._loop, name="stall-watchdog", daemon=True)
+                self.thread.start()
+
+    def remove(self, proc):
+        with self.lock:
+            self.watched.pop(id(proc), None)
+
+    def _loop(self):
+        while True:
+            time.sleep(CHECK_INTERVAL)
+            with self.lock:
+                items = list(self.watched.values())
+                if not items:
+                    self.thread = None
+                    return
+            for proc, progress in items:
+                if proc.poll() is not None or getattr(progress, 'idle', None): continue
+                idle = progress.stalled()
+                if idle is not None:
+                    progress.idle = idle
+                    proc.kill()
+
+
+_monitor = _Monitor()
+
+
+@contextmanager
+def watch(proc, tool, cmd, output=None):
+    """监视一个 Popen：调用方每读到 / 写出一块数据就调用 touch()；卡死时杀掉进程，退出时抛出 ProcessStalled"""
+    progress = Progress(proc.pid, tool, output)
+    progress.idle = None
+    _monitor.add(proc, progress)
+    try:
+        yield progress
+    except Exception:
+        if progress.idle is None: raise
+    finally:
+        _monitor.remove(proc)
+    if progress.idle is not None:
+        record(tool, cmd, progress.idle, 'skip')
+        raise ProcessStalled(tool, cmd, progress.idle)
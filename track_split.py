@@ -0,0 +1,101 @@
+import os
+import re
+import subprocess
+
+from job_engine import engine, startupinfo
+
+try:
+    import numpy as np
+
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+RATE = 8000  # 静音检测用的降采样率
+WINDOW = 0.05  # 50ms RMS 窗口
+CHUNK_SECONDS = 10
+
+
+def chapter_segments(info):
+    """yt-dlp 提供的章节 -> [(开始, 结束, 标题)]，少于两章时返回空列表"""
+    chapters = [c for c in (info.get('chapters') or []) if c.get('end_time') is not None]
+    if len(chapters) < 2: return []
+    return [(float(c.get('start_time') or 0), float(c['end_time']), c.get('title')) for c in chapters]
+
+
+def detect_silence(path, threshold=-45.0, min_silence=2.0):
+    """流式静音检测：ffmpeg 输出 8kHz 单声道 PCM，按块读取，50ms 窗口的 RMS 整块向量化计算。
+
+    任何时刻内存里只有一个块 (10 秒)，跨块的静音段用 run_start 接上。返回 [(开始, 结束)] 秒。
+    """
+    cmd = ['ffmpeg', '-v', 'error', '-i', path, '-map', '0:a:0', '-ac', '1', '-ar', str(RATE), '-f', 'f32le', '-']
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, **startupinfo())
+    win = int(RATE * WINDOW)
+    silences, run_start, done, rest = [], None, 0, np.zeros(0, dtype=np.float32)
+    try:
+        with engine().watch(proc, 'ffmpeg', cmd) as progress:
+            while True:
+                raw = proc.stdout.read(RATE * CHUNK_SECONDS * 4)
+                if not raw: break
+                progress.touch()
+                x = np.concatenate([rest, np.frombuffer(raw[:len(raw) // 4 * 4], dtype='<f4')])
+                n = len(x) // win
+                rest = x[n * win:]
+                if not n: continue
+                db = 10 * np.log10(np.mean(np.square(x[:n * win].reshape(n, win)), axis=1) + 1e-12)
+                quiet = db < threshold
+                prev = np.concatenate([[run_start is not None], quiet[:-1]])
+                # 只遍历状态翻转的位置，数量很少
+                for i in np.flatnonzero(quiet != prev):
+                    t = (done + i) * WINDOW
+                    if quiet[i]:
+                        run_start = t
+                    else:
+                        if t - run_start >= min_silence: silences.append((float(run_start), float(t)))
+                        run_start = None
+                done += n
+    finally:
+        proc.stdout.close()
+        proc.wait()
+    return silences
+
+
+def silence_segments(silences, duration, min_track=60.0):
+    """在每段静音中点切开，太短的段并入前一段"""
+    cuts = [0.0]
+    for s, e in silences:
+        mid = (s + e) / 2
+        if mid - cuts[-1] >= min_track and duration - mid >= min_track:
+            cuts.append(mid)
+    cuts.append(duration)
+    if len(cuts) < 3: return []
+    return [(cuts[i], cuts[i + 1], None) for i in range(len(cuts) - 1)]
+
+
+def _safe(name):
+    return re.sub(r'[\\/:*?"<>|]', '_', name).strip() or 'Track'
+
+
+def split_tracks(src, segments, out_dir, metadata=None):
+    """按段落流复制切分 (连同封面一起复制)，每段一个 ffmpeg，只读取对应区间。
+
+    流复制失败 (例如源编码不适合 ipod 容器) 时该段改为 AAC 转码。返回生成的文件列表。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    total = len(segments)
+    outputs = []
+    for i, (start, end, title) in enumerate(segments, 1):
+        title = title or f"Track {i:02d}"
+        out = os.path.join(out_dir, f"{i:02d} - {_safe(title)}.m4a")
+        cmd = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-ss', f"{start:.3f}", '-i', src,
+               '-t', f"{end - start:.3f}", '-map', '0:a:0', '-map', '0:v?', '-c', 'copy']
+        tags = dict(metadata or {}, title=title, track=f"{i}/{total}")
+        for k, v in tags.items():
+            cmd.extend(['-metadata', f'{k}={v}'])
+        cmd.extend(['-f', 'ipod', out])
+        if engine().run(cmd).returncode != 0:
+            at = cmd.index('-c')
+            cmd[at:at + 2] = ['-c:v', 'copy', '-c:a', 'aac', '-b:a', '320k']
+            engine().run(cmd, check=True)
+        outputs.append(out)
+    return outputs
@@ -1,11 +1,11 @@
 import sys
 import os
-import subprocess
 import shutil
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QLabel, QLineEdit, QPushButton,
                              QFileDialog, QTextEdit, QGroupBox, QMessageBox)
 from PyQt6.QtCore import QThread, pyqtSignal
+from job_engine import engine
 class Worker(QThread):
     log = pyqtSignal(str)
     finished = pyqtSignal()
@@ -24,7 +24,7 @@ class Worker(QThread):
                 shutil.copy2(file_path, temp_ncm)
                 self.log.emit("硬解密中...")
                 cmd = [self.ncmdump_exe, temp_ncm]
-                proc = subprocess.run(cmd, capture_output=True, text=True)
+                proc = engine().run(cmd, pool='ncmdump', text=True)
                 try:
                     os.remove(temp_ncm)
                 except:
@@ -72,7 +72,7 @@ class Worker(QThread):
         cmd.extend(['-map', '0:a', '-vn'])
         cmd.extend(['-c:a', 'alac', '-f', 'ipod'])
         cmd.append(out)
-        subprocess.run(cmd, check=True)
+        engine().run(cmd, check=True)
 class NCMCommander(QMainWindow):
     def __init__(self):
         super().__init__()
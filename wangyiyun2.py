@@ -1,18 +1,23 @@
 import sys
 import os
-import subprocess
 import shutil
+import time
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QLabel, QLineEdit, QPushButton,
                              QFileDialog, QTextEdit, QGroupBox, QMessageBox,
                              QCheckBox, QComboBox)
 from PyQt6.QtCore import QThread, pyqtSignal
+from fingerprint import HAS_NUMPY, FingerprintIndex, fingerprint
+from job_engine import engine
+from segment_encode import MIN_DURATION, encode_segmented
+import prom_metrics
+from prom_metrics import ENCODE_SECONDS, JOBS, JOBS_ACTIVE, PROBE_CACHE
 
 class Worker(QThread):
     log = pyqtSignal(str)
     finished = pyqtSignal()
 
-    def __init__(self, files, save_dir, ncmdump_path, keep_cover, target_fmt):
+    def __init__(self, files, save_dir, ncmdump_path, keep_cover, target_fmt, dedupe='off', segment_encode=False):
         super().__init__()
         self.files = files
         self.save_dir = save_dir
@@ -28,10 +33,32 @@ class Worker(QThread):
             'ogg': '.ogg'
         }
         self.target_ext = self.ext_map.get(target_fmt, '.m4a')
+        # 重复检测: off / warn (仅提醒) / skip (跳过)
+        self.dedupe = dedupe
+        self.index = None
+        self.failed = 0
+        self.sample_rates = {}
+        self.durations = {}
+        # 开启后，超过这个时长 (秒) 的单个文件转 ALAC 时分段并行编码 (实验性，默认整段单次编码)
+        self.segment_encode = segment_encode
+        self.segment_min = MIN_DURATION
     def run(self):
+        # 本线程启动的外部进程都归到这个工作线程名下，窗口关闭 / 任务取消时一起杀掉
+        with engine().bound(self):
+            self.run_batch()
+    def run_batch(self):
         self.log.emit(f"启动任务: 目标格式 [{self.target_fmt.upper()}]")
+        if prom_metrics.start():
+            self.log.emit(f"📈 指标: http://127.0.0.1:{os.environ[prom_metrics.PORT_ENV]}/metrics")
         total = len(self.files)
+        if self.dedupe != 'off': self.index = self.open_index()
+        self.sample_rates = self.probe_sample_rates([f for f in self.files if not f.lower().endswith('.ncm')])
         for idx, file_path in enumerate(self.files):
+            if engine().cancelled(self):
+                self.log.emit("⏹️ 任务已取消")
+                break
+            JOBS_ACTIVE.inc(tool='ncm')
+            state = 'failed'
             try:
                 filename = os.path.basename(file_path)
                 file_ext = os.path.splitext(filename)[1].lower()
@@ -43,17 +70,31 @@ class Worker(QThread):
                     source_to_convert = file_path
                     is_temp = False
                 if not source_to_convert: continue
-                self.process_conversion(source_to_convert, filename, is_temp)
+                state = self.process_conversion(source_to_convert, filename, is_temp)
             except Exception as e:
                 self.log.emit(f"异常跳过: {e}")
+            finally:
+                JOBS_ACTIVE.dec(tool='ncm')
+                JOBS.inc(tool='ncm', state=state)
+                if state == 'failed': self.failed += 1
+        if self.index: self.index.close()
         self.finished.emit()
+    def open_index(self):
+        if not HAS_NUMPY:
+            self.log.emit("⚠️ 未安装 numpy，重复检测已关闭")
+            return None
+        index = FingerprintIndex(os.path.join(self.save_dir, '.fingerprints.sqlite'))
+        self.log.emit("🧬 正在更新输出库指纹索引...")
+        added = index.scan(self.save_dir, self.log)
+        self.log.emit(f"🧬 索引完成 (新增 {added} 个文件)")
+        return index
     def process_ncm_decrypt(self, file_path, filename):
         """解密并返回解密后的临时文件路径"""
         temp_ncm = os.path.join(self.save_dir, filename)
         shutil.copy2(file_path, temp_ncm)
         self.log.emit("[NCM] 正在解密...")
         cmd = [self.ncmdump_exe, temp_ncm]
-        subprocess.run(cmd, capture_output=True, text=True)
+        engine().run(cmd, pool='ncmdump', text=True)
         # 删除 NCM 副本
         try:
             os.remove(temp_ncm)
@@ -71,19 +112,37 @@ class Worker(QThread):
             self.log.emit("NCM 解密失败，未找到产物。")
             return None
         return decrypted_file
+    def rate_cmd(self, filepath):
+        # 采样率和时长一起取 (输出两行：先 stream 再 format)
+        return ['ffprobe', '-v', 'error', '-select_streams', 'a:0',
+                '-show_entries', 'stream=sample_rate:format=duration', '-of',
+                'default=noprint_wrappers=1:nokey=1', filepath]
+    def parse_probe(self, filepath, stdout):
+        lines = stdout.split()
+        rate = int(lines[0])
+        try:
+            self.durations[filepath] = float(lines[1])
+        except (IndexError, ValueError):
+            pass
+        return rate
+    def probe_sample_rates(self, paths):
+        """所有非 NCM 文件的采样率一次性并发探测 (共享引擎，不为每个文件开线程)"""
+        if not paths: return {}
+        rates = {}
+        for path, res in zip(paths, engine().map([self.rate_cmd(p) for p in paths], pool='probe', timeout=30, text=True)):
+            try:
+                rates[path] = self.parse_probe(path, res.stdout)
+            except Exception:
+                pass
+        return rates
     def get_sample_rate(self, filepath):
         """获取音频采样率"""
+        # 批量预探测也是真的调了 ffprobe，单独计为 prefetch，不算命中
+        PROBE_CACHE.inc(tool='ncm', result='prefetch' if filepath in self.sample_rates else 'miss')
+        if filepath in self.sample_rates: return self.sample_rates[filepath]
         try:
-            cmd = ['ffprobe', '-v', 'error', '-select_streams', 'a:0',
-                   '-show_entries', 'stream=sample_rate', '-of',
-                   'default=noprint_wrappers=1:nokey=1', filepath]
-            # 隐藏窗口运行
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-
-            res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                 text=True, startupinfo=startupinfo)
-            return int(res.stdout.strip())
+            res = engine().run(self.rate_cmd(filepath), pool='probe', timeout=30, text=True)
+            return self.parse_probe(filepath, res.stdout)
         except:
             return 44100 
     def process_conversion(self, source_path, original_filename, is_temp_file):
@@ -93,19 +152,47 @@ class Worker(QThread):
         # 检测采样率
         sample_rate = self.get_sample_rate(source_path)
         self.log.emit(f"🔍 采样率检测: {sample_rate} Hz")
+        # 转换前先查库里有没有同一录音 (B站 / YouTube / 网易云 的同一首歌)
+        fp = None
+        if self.index:
+            fp = fingerprint(source_path)
+            dup = self.index.match(fp, exclude=source_path)
+            if dup:
+                self.log.emit(f"⚠️ 库中已有近似录音: {os.path.basename(dup[0])} (差异 {dup[1]:.0%})")
+                if self.dedupe == 'skip':
+                    self.log.emit("⏭️ 已跳过")
+                    if is_temp_file:
+                        try:
+                            os.remove(source_path)
+                        except:
+                            pass
+                    return 'skipped'
         try:
             # 调用 FFmpeg
+            t0 = time.perf_counter()
             self.convert_ffmpeg(source_path, final_path, sample_rate)
+            ENCODE_SECONDS.observe(time.perf_counter() - t0, tool='ncm')
             self.log.emit(f"转换完成: {os.path.basename(final_path)}")
+            if fp is not None: self.index.add(final_path, fp)
             # 清理临时文件
             if is_temp_file:
                 try:
                     os.remove(source_path)
                 except:
                     pass
+            return 'ok'
         except Exception as e:
             self.log.emit(f"转码失败: {e}")
+            return 'failed'
     def convert_ffmpeg(self, inp, out, sample_rate):
+        # 超长的单个文件 (整场录音 / 大 WAV) 转 ALAC 时切段并行编码；封面与标签仍取自源文件
+        duration = self.durations.get(inp, 0)
+        if self.segment_encode and self.target_fmt == 'alac' and duration >= self.segment_min:
+            codec = ['-c:a', 'alac'] + (['-sample_fmt', 's16p'] if sample_rate <= 48000 else [])
+            if encode_segmented(inp, out, sample_rate, duration, codec,
+                                cover=inp if self.keep_cover else None, tags_from=inp):
+                self.log.emit(f"🧩 分段并行编码 ({duration / 60:.0f} 分钟)")
+                return
         cmd = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-i', inp]
         # 音频流映射
         cmd.extend(['-map', '0:a'])
@@ -144,9 +231,7 @@ class Worker(QThread):
         elif self.target_fmt == 'wav':
             cmd.extend(['-c:a', 'pcm_s16le', '-f', 'wav'])
         cmd.append(out)
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        subprocess.run(cmd, check=True, startupinfo=startupinfo)
+        engine().run(cmd, check=True)
 class UniversalCommander(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -202,6 +287,17 @@ class UniversalCommander(QMainWindow):
         self.chk_cover = QCheckBox("尝试保留封面图片 (WAV/OGG 除外)")
         self.chk_cover.setChecked(True)
         l2.addWidget(self.chk_cover)
+        self.chk_segment = QCheckBox("超长文件分段并行编码 (实验性，仅 ALAC)")
+        self.chk_segment.setToolTip("30 分钟以上的单个文件切段并行编码后无缝拼接；不勾选时整段单次编码")
+        l2.addWidget(self.chk_segment)
+        h_dup = QHBoxLayout()
+        h_dup.addWidget(QLabel("重复检测:"))
+        self.combo_dup = QComboBox()
+        self.combo_dup.addItems(["关闭", "仅提醒", "跳过重复"])
+        self.combo_dup.setToolTip("按音频指纹比对输出目录中已有的歌曲 (需要 numpy)")
+        self.combo_dup.setEnabled(HAS_NUMPY)
+        h_dup.addWidget(self.combo_dup)
+        l2.addLayout(h_dup)
         l2.addWidget(QLabel("💡 智能逻辑: 若源文件采样率 ≤ 48kHz，无损格式将自动使用 16-bit 以节省空间。"))
         g2.setLayout(l2)
         layout.addWidget(g2)
@@ -235,7 +331,9 @@ class UniversalCommander(QMainWindow):
 
         self.btn_run.setEnabled(False)
         self.worker = Worker(self.files, out_dir, self.ncmdump_path,
-                             self.chk_cover.isChecked(), target_fmt)
+                             self.chk_cover.isChecked(), target_fmt,
+                             ['off', 'warn', 'skip'][self.combo_dup.currentIndex()],
+                             self.chk_segment.isChecked())
         self.worker.log.connect(self.log_txt.append)
         self.worker.finished.connect(
             lambda: [self.btn_run.setEnabled(True), QMessageBox.information(self, "完成", "所有任务已处理完毕!")])
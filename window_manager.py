@@ -0,0 +1,158 @@
+import gc
+import os
+import sys
+import ctypes
+from functools import partial
+
+from PyQt6.QtCore import QObject, QEvent, Qt, QTimer
+
+from job_engine import engine
+
+# 每个工具窗口日志最多保留的行数，超出后最早的行被丢弃
+LOG_LINES = 5000
+REPORT_INTERVAL = 5000  # ms
+# 工作线程的完成信号 (各工具命名不一)；窗口转入后台时断开，避免跑完后弹出完成对话框
+FINISH_SIGNALS = ('finished_signal', 'finished')
+
+
+class _MemoryCounters(ctypes.Structure):
+    _fields_ = [('cb', ctypes.c_ulong), ('PageFaultCount', ctypes.c_ulong),
+                ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+
+def process_rss():
+    """当前进程的常驻内存 (字节)，取不到时返回 None"""
+    try:
+        if sys.platform == 'win32':
+            counters = _MemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+            return None
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        return None
+
+
+def _running(worker):
+    return worker is not None and worker.isRunning()
+
+
+class WindowManager(QObject):
+    """工具窗口的生命周期管理。
+
+    - 单实例模式下再次点击只把已有窗口调到前台
+    - 关闭的窗口立即释放 (WA_DeleteOnClose)；工作线程还在跑时取消它的任务 (杀掉外部进程)，
+      窗口先隐藏转入后台，线程退出后再释放，避免 QThread 在运行中被销毁
+    - 限制日志控件的行数，定时在状态栏报告各工具的窗口数、日志文本大小与整个进程的内存
+      (所有工具跑在同一个进程里，内存无法按工具拆分)
+    """
+
+    def __init__(self, status_label=None, single_instance=True, parent=None):
+        super().__init__(parent)
+        self.status_label = status_label
+        self.single_instance = single_instance
+        self.windows = {}  # key -> [窗口]
+        self.names = {}
+        self.draining = []  # [(key, 窗口)] 已关闭但工作线程仍在运行
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.report)
+        self.timer.start(REPORT_INTERVAL)
+
+    def open(self, key, config):
+        alive = self.windows.get(key) or []
+        if self.single_instance and alive:
+            window = alive[-1]
+            if window.isMinimized(): window.showNormal()
+            window.raise_()
+            window.activateWindow()
+            return window
+        window = config['class_obj']()
+        window.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose, True)
+        log = getattr(window, 'log_txt', None)
+        if log is not None: log.document().setMaximumBlockCount(LOG_LINES)
+        window.installEventFilter(self)
+        # 关闭可能被窗口自己拒绝，真正销毁时才从登记表移除
+        window.destroyed.connect(partial(self._forget, key, window))
+        self.windows.setdefault(key, []).append(window)
+        self.names[key] = config['name']
+        window.show()
+        self.report()
+        return window
+
+    def _key(self, window):
+        for key, alive in self.windows.items():
+            if window in alive: return key
+        return None
+
+    def _forget(self, key, window, *_):
+        alive = self.windows.get(key)
+        if alive is None or window not in alive: return
+        alive.remove(window)
+        if not alive: del self.windows[key]
+        QTimer.singleShot(0, self.report)
+
+    def eventFilter(self, obj, event):
+        if event.type() != QEvent.Type.Close: return False
+        key = self._key(obj)
+        if key is None: return False
+        worker = getattr(obj, 'worker', None)
+        if not _running(worker): return False
+        # 任务还在跑：取消任务，隐藏窗口转入后台，线程退出后再释放
+        engine().cancel(worker)
+        for name in FINISH_SIGNALS:
+            try:
+                getattr(worker, name).disconnect()
+            except (AttributeError, TypeError, RuntimeError):
+                pass
+        obj.hide()
+        self._forget(key, obj)
+        self.draining.append((key, obj))
+        event.ignore()
+        self.report()
+        return True
+
+    def reap(self):
+        """释放工作线程已经结束的后台窗口"""
+        keep = []
+        for key, window in self.draining:
+            if _running(getattr(window, 'worker', None)):
+                keep.append((key, window))
+            else:
+                window.removeEventFilter(self)
+                window.deleteLater()
+        if len(keep) != len(self.draining):
+            self.draining = keep
+            gc.collect()
+
+    def stats(self):
+        result = {}
+        for key, alive in self.windows.items():
+            s = result.setdefault(key, {'windows': 0, 'running': 0, 'log_bytes': 0})
+            for window in alive:
+                s['windows'] += 1
+                log = getattr(window, 'log_txt', None)
+                if log is not None: s['log_bytes'] += log.document().characterCount() * 2
+                if _running(getattr(window, 'worker', None)): s['running'] += 1
+        for key, window in self.draining:
+            s = result.setdefault(key, {'windows': 0, 'running': 0, 'log_bytes': 0})
+            s['running'] += 1
+            log = getattr(window, 'log_txt', None)
+            if log is not None: s['log_bytes'] += log.document().characterCount() * 2
+        return result
+
+    def report(self):
+        self.reap()
+        if self.status_label is None: return
+        parts = []
+        for key, s in self.stats().items():
+            state = f" / 运行 {s['running']}" if s['running'] else ""
+            parts.append(f"{self.names.get(key, key)}: {s['windows']} 窗口{state}, 日志文本约 {s['log_bytes'] / 1024:.0f}KB")
+        rss = process_rss()
+        total = f"进程内存 (全部工具) {rss / 1048576:.0f}MB" if rss else "进程内存 -"
+        self.status_label.setText(" | ".join([total] + parts) if parts else f"Ready. ({total})")
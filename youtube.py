@@ -1,77 +1,27 @@
 import sys
 import os
-import subprocess
-import time
 import shutil
 import yt_dlp
-import subprocess
-from datetime import datetime
-# 检测 rookiepy
-try:
-    import rookiepy
-
-    HAS_ROOKIE = True
-except ImportError:
-    HAS_ROOKIE = False
-
+from download_archive import DownloadArchive, archive_key
+from media_pipeline import PostProcessPipeline
+from cookie_jar import HAS_ROOKIE, cookie_manager
+from rate_limiter import LimitedYoutubeDL, throttled_hosts
+from playlist_recon import iter_entries
+from download_metrics import DownloadMetrics
+import prom_metrics
+from media_plan import audio_codec, audio_params, find_cover, plan_audio, plan_split, split_av_formats, split_paths
+from media_stream import fetch_thumbnail, stream_into, streamable, verify_output
+from job_engine import engine
+from segment_encode import MIN_DURATION, encode_segmented
+from track_split import HAS_NUMPY, chapter_segments, detect_silence, silence_segments, split_tracks
+from job_journal import JobJournal, DOWNLOADING, DOWNLOADED, POSTPROCESSED, FAILED
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QLabel, QLineEdit, QPushButton,
                              QRadioButton, QButtonGroup, QFileDialog, QTextEdit,
                              QGroupBox, QMessageBox, QCheckBox)
 from PyQt6.QtCore import QThread, pyqtSignal
-def auto_renew_cookies(target_file='youtube_cookies.txt', logger=None):
-    if not HAS_ROOKIE: return False, "缺少 rookiepy"
-    domains = ["youtube.com", "google.com"]
-    cookies = []
-    source_used = "Unknown"
-    try:
-        if logger: logger.emit("Trying Chrome...")
-        cookies = rookiepy.chrome(domains)
-        source_used = "Chrome"
-    except Exception as e:
-        if logger: logger.emit(f"Chrome 提取失败: {e}")
-        try:
-            if logger: logger.emit("Trying Edge...")
-            cookies = rookiepy.edge(domains)
-            source_used = "Edge"
-        except Exception as e2:
-            if logger: logger.emit(f"Edge 提取失败: {e2}")
-            try:
-                if logger: logger.emit("Trying Firefox...")
-                cookies = rookiepy.firefox(domains)
-                source_used = "Firefox"
-            except Exception as e3:
-                return False, f"所有浏览器均失败，请尝试【以管理员身份运行】脚本。"
-    try:
-        if not cookies: return False, "未找到 Cookie，请确保已在浏览器登录 YouTube"
-
-        with open(target_file, 'w', encoding='utf-8') as f:
-            f.write("# Netscape HTTP Cookie File\n")
-            f.write(f"# Generated at {datetime.now()} from {source_used}\n\n")
-            for c in cookies:
-                if isinstance(c, dict):
-                    domain = c.get('domain', '')
-                    path = c.get('path', '/')
-                    secure = "TRUE" if c.get('secure', False) else "FALSE"
-                    expires = c.get('expires', 0)
-                    name = c.get('name', '')
-                    value = c.get('value', '')
-                else:
-                    domain = getattr(c, 'domain', '')
-                    path = getattr(c, 'path', '/')
-                    secure = "TRUE" if getattr(c, 'secure', False) else "FALSE"
-                    expires = getattr(c, 'expires', 0)
-                    name = getattr(c, 'name', '')
-                    value = getattr(c, 'value', '')
-                if expires is None: expires = 0
-                expiration = str(int(expires))
-                flag = "TRUE" if domain.startswith('.') else "FALSE"
-                f.write(f"{domain}\t{flag}\t{path}\t{secure}\t{expiration}\t{name}\t{value}\n")
-        return True, f"成功从 {source_used} 刷新 ({len(cookies)} 条)"
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return False, f"写入文件逻辑错误: {e}"
+def auto_renew_cookies(target_file='youtube_cookies.txt', logger=None, force=True):
+    return cookie_manager(["youtube.com", "google.com"], target_file).refresh(logger, force)
 class YouTubeWorker(QThread):
     log_signal = pyqtSignal(str)
     finished_signal = pyqtSignal()
@@ -79,21 +29,37 @@ class YouTubeWorker(QThread):
         super().__init__()
         self.params = params
         self.cookie_filename = 'youtube_cookies.txt'
+        self.cookie_jar = cookie_manager(["youtube.com", "google.com"], self.cookie_filename)
+        self.session = None
+        self.session_stamp = None
+        self.sessions_built = 0
+        self.archive_filename = 'youtube_archive.txt'
+        self.journal_filename = 'youtube_jobs.sqlite'
+        self.metrics_filename = 'youtube_metrics.jsonl'
         self.user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
     class MyLogger:
-        def __init__(self, signal): self.signal = signal
-        def debug(self, msg): pass
+        def __init__(self, signal, metrics=None):
+            self.signal = signal
+            self.metrics = metrics
+        def debug(self, msg):
+            if self.metrics: self.metrics.on_message(msg)
         def info(self, msg): self.signal.emit(msg)
-        def warning(self, msg): self.signal.emit(f"{msg}")
+        def warning(self, msg):
+            if self.metrics: self.metrics.on_message(msg)
+            self.signal.emit(f"{msg}")
         def error(self, msg): self.signal.emit(f"{msg}")
     # Node.js 检测
     def check_nodejs(self):
         try:
-            subprocess.run(["node", "--version"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            engine().run(["node", "--version"], pool='node', check=True)
             return True
         except:
             return False
     def run(self):
+        # 本线程启动的外部进程都归到这个工作线程名下，窗口关闭 / 任务取消时一起杀掉
+        with engine().bound(self):
+            self.run_batch()
+    def run_batch(self):
         self.log_signal.emit(f"[YouTube] v1.6 格式修复版启动！")
         self.log_signal.emit(f"当前 yt-dlp 版本: {yt_dlp.version.__version__}")
         if not self.check_nodejs():
@@ -104,48 +70,62 @@ class YouTubeWorker(QThread):
                 self.log_signal.emit("缺少 rookiepy")
             else:
                 self.log_signal.emit("初始化 Cookie...")
-                success, msg = auto_renew_cookies(self.cookie_filename, self.log_signal)
+                success, msg = auto_renew_cookies(self.cookie_filename, self.log_signal, force=False)
                 if success:
                     self.log_signal.emit(f"{msg}")
                 else:
                     self.log_signal.emit(f"初始化失败: {msg}")
-        video_queue = []
-        try:
-            self.log_signal.emit("正在侦察...")
-            recon_opts = {
-                'extract_flat': True,
-                'ignoreerrors': True,
-                'cookiefile': self.cookie_filename if os.path.exists(self.cookie_filename) else None,
-                'user_agent': self.user_agent,
-                'logger': self.MyLogger(self.log_signal),
-                'nocheckcertificate': True,
-                'cachedir': False,  
-            }
-            with yt_dlp.YoutubeDL(recon_opts) as ydl:
-                info = ydl.extract_info(self.params['url'], download=False)
-                if 'entries' in info:
-                    entries = list(info['entries'])
-                    self.log_signal.emit(f"列表共 {len(entries)} 个任务")
-                    for e in entries: video_queue.append(e)
-                else:
-                    video_queue.append(info)
-        except Exception as e:
-            self.log_signal.emit(f"💥 侦察失败: {e}")
-            self.finished_signal.emit()
-            return
-        total = len(video_queue)
+        self.journal = journal = JobJournal(os.path.join(self.params['save_dir'], self.journal_filename))
+        self.metrics = DownloadMetrics(os.path.join(self.params['save_dir'], self.metrics_filename), 'youtube')
+        if prom_metrics.start():
+            self.log_signal.emit(f"📈 指标: http://127.0.0.1:{os.environ[prom_metrics.PORT_ENV]}/metrics")
+        job_id, resumed = journal.open_job(self.params['url'], self.params['mode'])
+        if resumed and journal.recon_done(job_id):
+            self.log_signal.emit(f"发现未完成的任务日志 {journal.counts(job_id)}，跳过侦察")
+            video_queue = journal.entries(job_id)
+            total = len(video_queue)
+        else:
+            # 流式侦察：第一条到手就开始下载
+            self.log_signal.emit("正在侦察 (流式)...")
+            video_queue = self.stream_queue(journal, job_id)
+            total = '?'
+        self.archive = archive = DownloadArchive(os.path.join(self.params['save_dir'], self.archive_filename))
+        self.log_signal.emit(f"下载档案: {len(archive)} 条记录")
+        self.pipeline = PostProcessPipeline(self.post_process_job, self.params.get('post_workers', 2),
+                                            self.params.get('pipeline_depth', 2), self.log_signal)
         for idx, item in enumerate(video_queue):
-            target_url = item.get('url') or item.get('webpage_url')
+            if engine().cancelled(self):
+                self.log_signal.emit("任务已取消，剩余条目下次续跑")
+                break
+            if item['state'] in (POSTPROCESSED, FAILED): continue
+            target_url = item.get('url')
             if not target_url and item.get('id'):
                 target_url = f"https://www.youtube.com/watch?v={item['id']}"
 
-            title = item.get('title', f'Unknown_{idx}')
+            title = item.get('title') or f'Unknown_{idx}'
+            # 档案命中直接跳过，无需联网
+            if archive.is_done(item, self.params['mode']):
+                self.log_signal.emit(f"[{idx + 1}/{total}] 已在档案中: {title}")
+                self.metrics.skipped()
+                journal.set_state(item, POSTPROCESSED)
+                continue
+            if item['state'] == DOWNLOADED and item['source_path'] and os.path.exists(item['source_path']):
+                self.log_signal.emit(f"[{idx + 1}/{total}] 补跑后期处理: {title}")
+                self.queue_post(item['source_path'], item['info'] or {}, item, item['base'])
+                continue
             self.log_signal.emit(f"\n🎬 [{idx + 1}/{total}] 处理: {title}")
 
+            done = False
             max_retries = 3
             for attempt in range(max_retries):
                 try:
-                    self.process_single_video(target_url, title)
+                    journal.set_state(item, DOWNLOADING)
+                    result = self.process_single_video(target_url, title, item)
+                    if result:
+                        self.record_archive(archive, item, *result)
+                        journal.set_state(item, POSTPROCESSED)
+                        self.metrics.finish(self.metrics_for(item))
+                    done = True
                     break
                 except yt_dlp.utils.DownloadError as e:
                     err_msg = str(e).lower()
@@ -157,8 +137,8 @@ class YouTubeWorker(QThread):
                             success, msg = auto_renew_cookies(self.cookie_filename, self.log_signal)
                             if success:
                                 self.log_signal.emit(f"{msg}")
-                                self.log_signal.emit("冷却 10 秒...")
-                                time.sleep(10)
+                                # 冷却交给限速器的指数退避
+                                for s in throttled_hosts(): self.log_signal.emit(f"限速状态: {s}")
                                 continue
                             else:
                                 self.log_signal.emit(f"续命失败: {msg}")
@@ -172,78 +152,272 @@ class YouTubeWorker(QThread):
                 except Exception as e:
                     self.log_signal.emit(f"未知错误: {e}")
                     break
+            # 取消打断的条目不记失败，下次续跑
+            if not done and not engine().cancelled(self):
+                journal.set_state(item, FAILED)
+                self.metrics.finish(self.metrics_for(item), 'failed')
+        self.log_signal.emit("等待后期处理完成...")
+        self.pipeline.close()
+        for s in throttled_hosts(): self.log_signal.emit(f"限速中: {s}")
+        for line in self.metrics.summary(): self.log_signal.emit(line)
+        self.close_session()
+        if journal.finish_job(job_id):
+            self.log_signal.emit(f"任务日志已完结: {journal.counts(job_id)}")
+        else:
+            self.log_signal.emit(f"任务未完结，下次启动将续跑: {journal.counts(job_id)}")
+        if self.params.get('sync') and journal.recon_done(job_id):
+            if journal.advance_sync(job_id, self.params['url']):
+                retry = len(journal.sync_retries(self.params['url']))
+                self.log_signal.emit("同步点已更新" + (f"，{retry} 个失败条目下次同步重试" if retry else ""))
+            else:
+                self.log_signal.emit("有未处理完的条目，同步点保持不变，下次启动续跑")
+        journal.close()
         self.finished_signal.emit()
-    def process_single_video(self, url, title_hint):
-        ydl_opts = {
+    def stream_queue(self, journal, job_id):
+        recon_opts = {
+            'extract_flat': True,
+            'ignoreerrors': True,
+            'cookiefile': self.cookie_filename if os.path.exists(self.cookie_filename) else None,
+            'user_agent': self.user_agent,
             'logger': self.MyLogger(self.log_signal),
-            'format': 'bestvideo+bestaudio/best',
+            'nocheckcertificate': True,
+            'cachedir': False,
+        }
+        count = 0
+        # 增量同步：列表按新到旧排列，遇到上次同步过的条目就停下，后面的页不再请求
+        known = journal.known_ids(self.params['url']) if self.params.get('sync') else set()
+        try:
+            with LimitedYoutubeDL(recon_opts) as ydl:
+                for idx, rec in enumerate(iter_entries(ydl, self.params['url'])):
+                    if rec.get('id') in known:
+                        self.log_signal.emit(f"到达上次同步点: {rec.get('title')}，不再翻页")
+                        break
+                    count = idx + 1
+                    yield journal.add_entry(job_id, idx, rec)
+        except Exception as e:
+            self.log_signal.emit(f"💥 侦察失败: {e}")
+            return
+        # 上次同步失败的条目不挡同步点，排在新条目后面重新入队
+        for rec in journal.sync_retries(self.params['url']) if self.params.get('sync') else []:
+            yield journal.add_entry(job_id, count, rec)
+            count += 1
+        journal.mark_recon_done(job_id)
+        self.log_signal.emit(f"侦察完成: 列表共 {count} 个任务")
+    def metrics_for(self, entry):
+        return self.metrics.begin(entry.get('id') or entry.get('idx'), entry.get('title'))
+    def record_archive(self, archive, entry, info, base):
+        parts = []
+        if os.path.exists(base + ".mp4"): parts.append('video')
+        if os.path.exists(base + ".m4a"): parts.append('audio')
+        archive.record(entry if archive_key(entry) else info, *parts)
+    def build_ydl_opts(self):
+        name_tmpl = os.path.join(self.params['save_dir'], '%(title)s.%(ext)s')
+        src_tmpl = {'audio': '%(title)s.src.%(ext)s', 'both': '%(title)s.f%(format_id)s.%(ext)s'}.get(self.params['mode'])
+        return {
+            'logger': self.MyLogger(self.log_signal, self.metrics),
+            'progress_hooks': [self.metrics.progress_hook],
+            'postprocessor_hooks': [self.metrics.postprocessor_hook],
+            # 仅音频：只拉最佳音轨，完全不下载视频
+            # 全都要：音视频流分开落盘不合并，后期处理一次读完同时产出 mp4 和 m4a
+            'format': {'audio': 'bestaudio/best', 'both': split_av_formats}.get(self.params['mode'], 'bestvideo+bestaudio/best'),
             'merge_output_format': 'mp4',
-            'outtmpl': os.path.join(self.params['save_dir'], '%(title)s.%(ext)s'),
+            'outtmpl': {'default': os.path.join(self.params['save_dir'], src_tmpl) if src_tmpl else name_tmpl,
+                        'thumbnail': name_tmpl},
+            # 封面保持原始 webp/jpg，后期处理时在同一个 ffmpeg 里转换并内嵌
             'writethumbnail': True,
-            'postprocessors': [{'key': 'FFmpegThumbnailsConvertor', 'format': 'jpg'}],
+            # 全都要模式按格式分两次下载，每次都会重新拉一遍封面；不覆盖已有文件，第二次直接用第一次下的
+            # (视频文件 yt-dlp 默认就不覆盖，其余模式保持默认)
+            'overwrites': False if self.params['mode'] == 'both' else None,
             'nocheckcertificate': True,
             'ignoreerrors': False,
             'noplaylist': True,
             'cookiefile': self.cookie_filename if os.path.exists(self.cookie_filename) else None,
             'user_agent': self.user_agent,
-            'sleep_interval': 3,
             'cachedir': False, 
         }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+    def get_session(self, m):
+        # 整批复用同一个 YoutubeDL (提取器、Cookie 解析、HTTP 连接池)，Cookie 文件变化时才重建
+        stamp = (self.cookie_jar.version,
+                 os.path.getmtime(self.cookie_filename) if os.path.exists(self.cookie_filename) else None)
+        with self.metrics.phase(m, 'session'):
+            if self.session is None or stamp != self.session_stamp:
+                if self.session is not None:
+                    self.session.close()
+                    self.log_signal.emit("Cookie 已变化，重建 yt-dlp 会话")
+                self.session = LimitedYoutubeDL(self.build_ydl_opts())
+                self.session_stamp = stamp
+                self.sessions_built += 1
+        return self.session
+    def close_session(self):
+        if self.session is None: return
+        self.session.close()
+        self.session = None
+        self.log_signal.emit(f"yt-dlp 会话建立 {self.sessions_built} 次 (其余条目复用)")
+    def process_single_video(self, url, title_hint, entry):
+        m = self.metrics_for(entry)
+        self.metrics.current = m
+        audio_only = self.params['mode'] == 'audio'
+        ydl = self.get_session(m)
+        with self.metrics.phase(m, 'extract'):
             info = ydl.extract_info(url, download=False)
-            filename = ydl.prepare_filename(info)
-            base = os.path.splitext(filename)[0]
+        filename = ydl.prepare_filename(info)
+        base = os.path.splitext(ydl.prepare_filename(info, 'thumbnail'))[0]
 
-            if self.params['mode'] == 'audio' and os.path.exists(base + ".m4a"):
-                self.log_signal.emit("音频已存在")
-                return
-            if self.params['mode'] != 'audio' and os.path.exists(base + ".mp4"):
-                self.log_signal.emit("视频已存在")
-                if self.params['mode'] == 'both' and not os.path.exists(base + ".m4a"):
-                    self.post_process(base + ".mp4", info)
-                return
-            self.log_signal.emit("开始下载...")
-            ydl.download([url])
-            if os.path.exists(base + ".mp4"):
-                self.post_process(base + ".mp4", info)
-    def post_process(self, video_path, info):
-        self.process_media(video_path, info.get('title'), info.get('uploader', 'YouTube'))
+        if audio_only and os.path.exists(base + ".m4a"):
+            self.log_signal.emit("音频已存在")
+            return info, base
+        if self.params['mode'] != 'audio' and os.path.exists(base + ".mp4"):
+            self.log_signal.emit("视频已存在")
+            if self.params['mode'] == 'both' and not os.path.exists(base + ".m4a"):
+                self.queue_post(base + ".mp4", info, entry, base)
+                return None
+            return info, base
+        if audio_only and self.params.get('stream_audio') and streamable(info):
+            if self.stream_audio(ydl, info, base, m):
+                return info, base
+        self.log_signal.emit("开始下载..." if not audio_only else "开始下载 (仅音轨)...")
+        with self.metrics.phase(m, 'download'):
+            # 直接用已提取的 info 下载，省掉 download([url]) 的第二次提取
+            ydl.process_ie_result(info, download=True)
+        if self.params['mode'] == 'both':
+            # 分开落盘的音视频流交给后期处理一次性合并 + 出音频，不再读两遍
+            video_src, source, afmt = split_paths(ydl, info)
+            if os.path.exists(video_src) and os.path.exists(source):
+                self.queue_post(source, dict(info, video_path=video_src, acodec=afmt.get('acodec'),
+                                             asr=afmt.get('asr')), entry, base)
+                return None
+            return info, base
+        source = filename if audio_only else base + ".mp4"
+        if os.path.exists(source):
+            # 交给后期处理线程，档案在处理完成后记录
+            self.queue_post(source, info, entry, base)
+            return None
+        return info, base
+    def queue_post(self, source_path, info, entry, base):
+        self.journal.set_state(entry, DOWNLOADED, source_path=source_path, base=base, info=info)
+        self.pipeline.submit(source_path, info, entry, base)
+    def post_process_job(self, source_path, info, entry, base):
+        m = self.metrics_for(entry)
+        try:
+            with engine().bound(self), self.metrics.phase(m, 'postprocess'):
+                m.audio = self.post_process(source_path, info, base)
+        except Exception:
+            if engine().cancelled(self): return
+            # 转换失败不记档案，条目记为失败，下次运行重新下载
+            self.journal.set_state(entry, FAILED)
+            self.metrics.finish(m, 'failed')
+            return
+        self.record_archive(self.archive, entry, info, base)
+        self.journal.set_state(entry, POSTPROCESSED)
+        self.metrics.finish(m)
+    def post_process(self, source_path, info, base):
+        action = self.process_media(source_path, info.get('title'), info.get('uploader', 'YouTube'), base, info)
+        self.split_audio(base, info)
+        return action
+    def split_audio(self, base, info):
+        # 长录音 (演唱会 / 整张专辑) 按章节或静音切成单曲放进子目录，整轨保留
+        audio_path = base + ".m4a"
+        if not self.params.get('split_tracks') or not os.path.exists(audio_path): return
+        try:
+            segments, how = chapter_segments(info), "章节"
+            if not segments and HAS_NUMPY and (info.get('duration') or 0) >= self.params.get('split_min_duration', 1200):
+                segments, how = silence_segments(detect_silence(audio_path), info['duration']), "静音检测"
+            if not segments: return
+            outputs = split_tracks(audio_path, segments, base + " [分轨]", {
+                'album': info.get('title'), 'artist': info.get('uploader', 'YouTube'), 'album_artist': 'YouTube Favorites'})
+            self.log_signal.emit(f"已按{how}切分为 {len(outputs)} 首")
+        except Exception as e:
+            self.log_signal.emit(f"切分失败: {e}")
+    def stream_audio(self, ydl, info, base, m):
+        # 边下边编码：音轨直接灌进 ffmpeg，不写中间文件；先写 .part 再改名，中断不会留下半成品
+        audio_path = base + ".m4a"
+        part = audio_path + ".part"
+        cover = fetch_thumbnail(ydl, info, base)
+        acodec, sr = audio_params(info)
+        cmd, _, planned = plan_audio('pipe:0', part, sr or 48000, cover, {
+            'title': info.get('title'), 'artist': info.get('uploader', 'YouTube'),
+            'album': self.params["album_name"], 'album_artist': 'YouTube Favorites'}, acodec)
+        self.log_signal.emit("边下边转")
+        ok = False
+        try:
+            with self.metrics.phase(m, 'download'):
+                stream_into(ydl, info, cmd, self.metrics.progress_hook)
+            verify_output(part, info.get('duration'))
+            os.replace(part, audio_path)
+            m.audio = planned
+            ok = True
+            self.split_audio(base, info)
+        except Exception as e:
+            self.log_signal.emit(f"流式处理失败，回退到文件模式: {e}")
+            if os.path.exists(part): os.remove(part)
+        if cover:
+            try:
+                os.remove(cover)
+            except:
+                pass
+        return ok
     def get_audio_sample_rate(self, filepath):
+        # 只在 info 里没有采样率时使用 (例如旧版任务日志续跑)
         try:
             cmd = ['ffprobe', '-v', 'error', '-select_streams', 'a:0', '-show_entries', 'stream=sample_rate', '-of',
                    'default=noprint_wrappers=1:nokey=1', filepath]
-            res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            res = engine().run(cmd, pool='probe', timeout=30, text=True)
             return int(res.stdout.strip())
         except:
             return 48000
-    def process_media(self, video_path, title, artist):
-        base_path = os.path.splitext(video_path)[0]
+    def process_media(self, video_path, title, artist, base_path=None, info=None):
+        base_path = base_path or os.path.splitext(video_path)[0]
         audio_path = base_path + ".m4a"
-        cover = None
-        for ext in ['.jpg', '.png', '.webp']:
-            if os.path.exists(base_path + ext): cover = base_path + ext; break
+        cover = find_cover(base_path)
         mode = self.params['mode']
-        if mode in ['audio', 'both'] and not os.path.exists(audio_path):
-            sr = self.get_audio_sample_rate(video_path)
-            self.log_signal.emit(f"采样率: {sr} Hz")
+        action = None
+        error = None
+        # 全都要模式下 video_path 是单独的音频流，视频流在 info['video_path']，mp4 在这里才合并
+        split_video = (info or {}).get('video_path')
+        if not split_video or not os.path.exists(split_video) or os.path.exists(base_path + ".mp4"):
+            split_video = None
+        need_audio = mode in ['audio', 'both'] and not os.path.exists(audio_path)
+        if need_audio or split_video:
+            acodec, sr = audio_params(info or {})
+            if need_audio:
+                prom_metrics.PROBE_CACHE.inc(tool=self.metrics.tool, result='hit' if sr else 'miss')
+                sr = sr or self.get_audio_sample_rate(video_path)
+                self.log_signal.emit(f"采样率: {sr} Hz")
+            tags = {'title': title, 'artist': artist,
+                    'album': self.params["album_name"], 'album_artist': 'YouTube Favorites'}
             try:
-                cmd = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-i', video_path]
-                if cover: cmd.extend(['-i', cover])
-                cmd.extend(['-map', '0:a'])
-                if cover: cmd.extend(['-map', '1', '-c:v:0', 'mjpeg', '-disposition:v:0', 'attached_pic'])
-                if sr > 48000:
-                    cmd.extend(['-c:a', 'alac', '-sample_fmt', 's32p'])
+                if split_video:
+                    cmd, _, planned = plan_split(split_video, video_path, base_path + ".mp4",
+                                                 audio_path if need_audio else None, sr, cover, tags, acodec)
                 else:
-                    cmd.extend(['-c:a', 'aac', '-b:a', '320k', '-ac', '2'])
-
-                cmd.extend(['-metadata', f'title={title}', '-metadata', f'artist={artist}'])
-                cmd.extend(
-                    ['-metadata', f'album={self.params["album_name"]}', '-metadata', 'album_artist=YouTube Favorites'])
-                cmd.extend(['-f', 'ipod', audio_path])
-                subprocess.run(cmd, check=True)
-                self.log_signal.emit(f"音频完成")
+                    cmd, _, planned = plan_audio(video_path, audio_path, sr, cover, tags, acodec)
+                # 超长的单个文件 (直播录像等) 切段并行编码，单个编码器只用得上一个核
+                duration = (info or {}).get('duration') or 0
+                if (self.params.get('segment_encode') and not split_video and planned == 'encode'
+                        and duration >= self.params.get('segment_min_duration', MIN_DURATION)
+                        and encode_segmented(video_path, audio_path, sr, duration, audio_codec(sr, acodec)[0], cover, tags)):
+                    self.log_signal.emit(f"分段并行编码 ({duration / 60:.0f} 分钟)")
+                else:
+                    engine().run(cmd, check=True)
+                action = planned
+                self.log_signal.emit(f"音频完成" if need_audio else "视频合并完成")
+                if split_video:
+                    for p in {split_video, video_path}:
+                        try:
+                            os.remove(p)
+                        except:
+                            pass
             except Exception as e:
                 self.log_signal.emit(f"转换失败: {e}")
+                error = e
+                # 半成品会被当成已完成，必须删掉；分开落盘的音视频流可能已损坏，也一并删掉，下次重新下载
+                for p in (audio_path if need_audio else None, base_path + ".mp4" if split_video else None,
+                          split_video, video_path if split_video else None):
+                    if p and os.path.exists(p):
+                        try:
+                            os.remove(p)
+                        except:
+                            pass
         if mode == 'audio':
             try:
                 os.remove(video_path)
@@ -254,6 +428,8 @@ class YouTubeWorker(QThread):
                 os.remove(cover)
             except:
                 pass
+        if error: raise error
+        return action
 class YouTubeCommander(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -317,6 +493,18 @@ class YouTubeCommander(QMainWindow):
         mode_hl.addWidget(self.rb_audio)
         mode_hl.addWidget(self.rb_video)
         mode_hl.addWidget(self.rb_both)
+        self.chk_stream = QCheckBox("边下边转")
+        self.chk_stream.setToolTip("仅音频模式：音轨直接送进 ffmpeg 编码，不落中间文件 (无法流式的格式自动回退)")
+        mode_hl.addWidget(self.chk_stream)
+        self.chk_split = QCheckBox("长录音分轨")
+        self.chk_split.setToolTip("演唱会 / 整张专辑：按章节切分，没有章节时对 20 分钟以上的录音做静音检测 (需要 numpy)")
+        mode_hl.addWidget(self.chk_split)
+        self.chk_segment = QCheckBox("分段编码")
+        self.chk_segment.setToolTip("实验性：30 分钟以上的单个文件切段并行编码后无缝拼接；不勾选时整段单次编码")
+        mode_hl.addWidget(self.chk_segment)
+        self.chk_sync = QCheckBox("增量同步")
+        self.chk_sync.setToolTip("每天重跑同一个收藏夹 / 列表时使用：从最新的条目往后翻，遇到上次同步过的条目即停止。\n只适用于新条目排在最前面的列表 (B站收藏夹、YouTube 喜欢的视频等)")
+        mode_hl.addWidget(self.chk_sync)
         mode_g.setLayout(mode_hl)
         set_l.addWidget(meta_g)
         set_l.addWidget(mode_g)
@@ -345,7 +533,11 @@ class YouTubeCommander(QMainWindow):
         p = {
             'url': url, 'save_dir': self.save_in.text(),
             'mode': mode, 'album_name': self.album_in.text(),
-            'auto_cookie': self.chk_auto_cookie.isChecked()
+            'auto_cookie': self.chk_auto_cookie.isChecked(),
+            'stream_audio': self.chk_stream.isChecked(),
+            'split_tracks': self.chk_split.isChecked(),
+            'segment_encode': self.chk_segment.isChecked(),
+            'sync': self.chk_sync.isChecked()
         }
         self.btn_run.setEnabled(False)
         self.log("--- 初始化 v1.6 Fix ---")